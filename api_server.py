@@ -2,26 +2,81 @@ from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status
 from fastapi.security import APIKeyHeader
 import logging
 import uvicorn
+import os
 import time
+import threading
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from dto.request.search_request import SearchQuery
 from dto.response.search_response import SearchResponse
 from dto.request.ingest_request import IngestRequest
 from dto.response.ingest_response import IngestResponse
-from config import API_KEY
+from config import API_KEY, SNAPSHOT_RESTORE_PATH, CHROMA_HOST
 from ingest.slack import SlackIngest
-from rag.vector_store_minilm import MiniLmVectorStore
+from ingest.slack_events import WriteBehindQueue
+from rag.store_factory import create_vector_store
+from rag.model_registry import model_registry
+from rag.snapshot import restore_snapshot
+from rag.migration import acquire_maintenance_lock
 from llm.ollama import OllamaLLM
-from routers import search, ingest, status
+from llm.admission import AdmissionControlledLLM
+from routers import search, ingest, status, slack_events
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Global instances (models are loaded lazily, not at import time)
+vector_store = create_vector_store()
+ollama = AdmissionControlledLLM(OllamaLLM())
+extractor = SlackIngest()
+event_queue = WriteBehindQueue(vector_store, extractor)
+restore_thread = None
+
+def restore_and_migrate():
+    """Populate an empty index from a snapshot, then migrate if it was built with another model"""
+    try:
+        restore_snapshot(vector_store, SNAPSHOT_RESTORE_PATH)
+    except Exception as e:
+        logger.error(f"Error restoring snapshot: {str(e)}")
+        return
+    if vector_store.needs_migration():
+        vector_store.start_migration()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global restore_thread
+    # Warm up models in the background so the server starts listening immediately
+    model_registry.preload_in_background(vector_store.model_specs())
+    
+    # With several workers, only the one holding the maintenance lock restores or
+    # migrates; the others pick up its index switch from active_index.json
+    maintainer = acquire_maintenance_lock()
+    if not maintainer:
+        logger.info("Another process maintains the index, skipping snapshot restore and migration")
+        if not CHROMA_HOST:
+            logger.warning(
+                "Another process is using the Chroma directory without CHROMA_HOST set. Embedded Chroma "
+                "clients do not see each other's writes; run a single worker or a Chroma server."
+            )
+    elif SNAPSHOT_RESTORE_PATH and os.path.exists(SNAPSHOT_RESTORE_PATH) and vector_store.collection.count() == 0:
+        # New replica: start from a snapshot instead of re-ingesting from Slack
+        restore_thread = threading.Thread(target=restore_and_migrate, name="snapshot-restore", daemon=True)
+        restore_thread.start()
+    elif vector_store.needs_migration():
+        # Re-embed into the configured model's collection while the old one keeps serving
+        vector_store.start_migration()
+    
+    event_queue.start()
+    yield
+    # Flush events that arrived since the last batch before shutting down
+    event_queue.stop()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Slack Bug Reports RAG API",
     description="API for searching and analyzing similar bug reports from Slack using RAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -32,27 +87,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global instances
-vector_store = MiniLmVectorStore()
-ollama = OllamaLLM()
-extractor = SlackIngest()
-
 
 # Initialize routers with dependencies
 search.init(vector_store, ollama)
 ingest.init(extractor, vector_store)
-status.init(vector_store, ollama)
+status.init(vector_store, ollama, event_queue)
+slack_events.init(event_queue)
 
 # Include routers
 app.include_router(search.SearchRouter)
 app.include_router(ingest.IngestRouter)
 app.include_router(status.StatusRouter)
+app.include_router(slack_events.SlackEventsRouter)
 
 # Endpoints
 @app.get("/")
 async def root():
     return {"message": "Slack Bug Reports RAG API is running"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once all models are loaded and any snapshot restore is done, 503 before"""
+    registry_status = model_registry.status()
+    registry_status["restoring_snapshot"] = restore_thread is not None and restore_thread.is_alive()
+    if not registry_status["ready"] or registry_status["restoring_snapshot"]:
+        raise HTTPException(status_code=503, detail=registry_status)
+    return registry_status
+
 
 
 
@@ -5,13 +5,72 @@ load_dotenv()
 
 # Slack API credentials
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+
+# Slack Events API write-behind queue
+# Pending events are flushed when this many are queued or the oldest is this many seconds old
+EVENTS_BATCH_SIZE = int(os.getenv("EVENTS_BATCH_SIZE", "64"))
+EVENTS_FLUSH_INTERVAL = float(os.getenv("EVENTS_FLUSH_INTERVAL", "2.0"))
+
+# Near-duplicate collapsing at ingest
+# Messages whose estimated Jaccard similarity to an indexed message reaches the
+# threshold are linked to it instead of being embedded again
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", "128"))
+DEDUP_BANDS = int(os.getenv("DEDUP_BANDS", "16"))
+
+# Per-channel sharding: one collection per channel, searched in parallel only for the
+# channels a query filters on. Changing this requires re-ingesting (or restoring a snapshot).
+SHARD_BY_CHANNEL = os.getenv("SHARD_BY_CHANNEL", "false").lower() == "true"
+SHARD_QUERY_WORKERS = int(os.getenv("SHARD_QUERY_WORKERS", "8"))
+
+# Per-request latency budgets
+# Default /search budget in ms when the request sets none (0 = unlimited), share of the
+# remaining budget reranking may use, and the least time worth starting an LLM call with
+SEARCH_DEADLINE_MS = int(os.getenv("SEARCH_DEADLINE_MS", "0"))
+DEADLINE_RERANK_SHARE = float(os.getenv("DEADLINE_RERANK_SHARE", "0.3"))
+DEADLINE_MIN_LLM_MS = int(os.getenv("DEADLINE_MIN_LLM_MS", "500"))
+
+# MMR diversification: candidates fetched per requested result when diversity > 0
+MMR_CANDIDATE_MULTIPLIER = int(os.getenv("MMR_CANDIDATE_MULTIPLIER", "4"))
+
+# Slack export bulk loading
+# Messages per add_messages batch and worker processes used to parse day files (0 = one per CPU)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "0"))
+
+# Offline batch search
+# Queries encoded per model call and concurrent LLM analyses in `main.py batch`
+BATCH_SEARCH_SIZE = int(os.getenv("BATCH_SEARCH_SIZE", "64"))
+BATCH_LLM_WORKERS = int(os.getenv("BATCH_LLM_WORKERS", "2"))
 
 # Ollama settings
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
 
+# LLM admission control
+# At most LLM_MAX_CONCURRENT generations run at once and LLM_MAX_QUEUE more wait up to
+# LLM_QUEUE_TIMEOUT seconds. Beyond that, requests are shed according to LLM_SHED_MODE:
+# - reject: respond 429
+# - retrieval_only: return the similar reports without an analysis
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "8"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_SHED_MODE = os.getenv("LLM_SHED_MODE", "retrieval_only")
+
 # Vector DB settings
 CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+# A Chroma server to use instead of the embedded on-disk client. Required for several
+# API workers: each embedded client keeps its own in-memory HNSW index, so documents
+# one process adds are not found by another process's queries.
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
+# Index snapshots
+# When set and the index is empty at startup, the API server restores this snapshot
+SNAPSHOT_RESTORE_PATH = os.getenv("SNAPSHOT_RESTORE_PATH")
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "1000"))
 
 # Embedding model
 # Available models:
@@ -21,5 +80,35 @@ CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
 # - e5-large-v2
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")  
 
+# Shared embedding service
+# When EMBEDDING_SERVICE_SOCKET is set, models are loaded once by the embedding service
+# process (python3 main.py embedding-service) and every API worker encodes through it.
+# Requests from all workers arriving within EMBEDDING_SERVICE_BATCH_WAIT seconds are
+# merged, up to EMBEDDING_SERVICE_MAX_BATCH texts.
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET")
+EMBEDDING_SERVICE_AUTHKEY = os.getenv("EMBEDDING_SERVICE_AUTHKEY", "embedding-service")
+EMBEDDING_SERVICE_MAX_BATCH = int(os.getenv("EMBEDDING_SERVICE_MAX_BATCH", "128"))
+EMBEDDING_SERVICE_BATCH_WAIT = float(os.getenv("EMBEDDING_SERVICE_BATCH_WAIT", "0.005"))
+# Seconds a request waits for the batcher before the service reports an error
+EMBEDDING_SERVICE_REQUEST_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_REQUEST_TIMEOUT", "120"))
+
+# Vector store variant
+# Available stores:
+# - minilm
+# - mpnet
+# - e5
+VECTOR_STORE = os.getenv("VECTOR_STORE", "minilm")
+
+# Optional embedding dimension reduction: "pca" (projection fitted on the corpus during
+# migration) or "matryoshka" (truncation, for Matryoshka-trained models); empty for none.
+# Changing either setting re-embeds the index through a migration.
+EMBEDDING_REDUCTION = os.getenv("EMBEDDING_REDUCTION", "")
+EMBEDDING_REDUCED_DIMENSION = int(os.getenv("EMBEDDING_REDUCED_DIMENSION", "256"))
+# Most documents used to fit the PCA projection
+PCA_FIT_SAMPLE = int(os.getenv("PCA_FIT_SAMPLE", "10000"))
+
+# Number of documents re-embedded per batch when migrating to a new embedding model
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "256"))
+
 # API key
 API_KEY = os.getenv("API_KEY")
\ No newline at end of file
@@ -1,6 +1,36 @@
+from datetime import date, datetime, time, timezone
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 
 class SearchQuery(BaseModel):
     query: str
-    max_results: int = 3
\ No newline at end of file
+    max_results: int = 3
+    # 0 returns plain top-k; higher values trade relevance for less redundant results (MMR)
+    diversity: float = Field(0.0, ge=0.0, le=1.0)
+    # Filters applied inside the index: only these channels, only reports in this date range
+    channels: Optional[List[str]] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    # Latency budget for the whole request; reranking and the LLM analysis are cut short to meet it
+    deadline_ms: Optional[int] = Field(None, gt=0)
+
+    @field_validator("end_date", mode="before")
+    @classmethod
+    def end_of_day(cls, value):
+        """An end_date without a time includes that whole day"""
+        if isinstance(value, str) and len(value) == 10:
+            try:
+                value = date.fromisoformat(value)
+            except ValueError:
+                return value
+        if isinstance(value, date) and not isinstance(value, datetime):
+            return datetime.combine(value, time.max)
+        return value
+
+    @field_validator("start_date", "end_date")
+    @classmethod
+    def utc_if_naive(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Slack timestamps are UTC epochs, so dates without a timezone are read as UTC"""
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
@@ -5,4 +5,6 @@ class SearchResponse(BaseModel):
     query: str
     similar_reports: List[Dict[str, Any]]
     analysis: str
-    processing_time: float
\ No newline at end of file
+    processing_time: float
+    # Stages skipped or cut short to keep the request responsive
+    degraded: List[str] = []
\ No newline at end of file
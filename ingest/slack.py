@@ -2,13 +2,43 @@ import logging
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from config import SLACK_BOT_TOKEN
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+UNKNOWN_USER = {"name": "Unknown", "real_name": "Unknown User"}
+
+def is_bug_report(text: str) -> bool:
+    """Filter for bug reports - you can customize this logic"""
+    text = text.lower()
+    return "bug" in text or "issue" in text or "error" in text
+
+def format_message(msg: Dict[str, Any], user: Dict[str, str]) -> Dict[str, Any]:
+    """Convert a raw Slack message into the shape the vector stores expect"""
+    formatted = {
+        "text": msg["text"],
+        "ts": msg["ts"],
+        "date": datetime.fromtimestamp(float(msg["ts"])).strftime('%Y-%m-%d %H:%M:%S'),
+        "user": user
+    }
+    # Thread state of a parent, used to detect threads that changed since indexing
+    if msg.get("reply_count"):
+        formatted["reply_count"] = msg["reply_count"]
+        formatted["latest_reply"] = msg.get("latest_reply", "")
+    return formatted
+
+def thread_unchanged(msg: Dict[str, Any], indexed_state: Optional[Dict[str, Any]]) -> bool:
+    """True if a history message's thread matches the state recorded when it was indexed"""
+    if indexed_state is None:
+        return False
+    return (
+        indexed_state.get("reply_count", 0) == msg.get("reply_count", 0)
+        and indexed_state.get("latest_reply", "") == msg.get("latest_reply", "")
+    )
+
 class SlackIngest:
     def __init__(self):
         self.client = WebClient(token=SLACK_BOT_TOKEN)
@@ -21,24 +51,30 @@ class SlackIngest:
             logger.error(f"Error getting channels: {e}")
             return []
     
-    def get_messages(self, channel_id: str, limit: int = 1000) -> List[Dict[str, Any]]:
-        """Extract messages from a Slack channel"""
+    def get_messages(self, channel_id: str, limit: int = 1000,
+                     indexed_threads: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Extract messages from a Slack channel
+        
+        indexed_threads maps the ts of already indexed parents to their recorded
+        reply_count/latest_reply. Parents whose thread has not changed are skipped
+        without fetching replies or user info, so they cost no API calls or encoding.
+        """
+        indexed_threads = indexed_threads or {}
         try:
             result = self.client.conversations_history(channel=channel_id, limit=limit)
             messages = result["messages"]
             
             # Process messages to extract useful information
             processed_messages = []
+            unchanged = 0
             for msg in messages:
                 if "text" in msg and msg["text"]:
-                    # Filter for bug reports - you can customize this logic
-                    if "bug" in msg["text"].lower() or "issue" in msg["text"].lower() or "error" in msg["text"].lower():
-                        processed_msg = {
-                            "text": msg["text"],
-                            "ts": msg["ts"],
-                            "date": datetime.fromtimestamp(float(msg["ts"])).strftime('%Y-%m-%d %H:%M:%S'),
-                            "user": self._get_user_info(msg.get("user", ""))
-                        }
+                    if is_bug_report(msg["text"]):
+                        if thread_unchanged(msg, indexed_threads.get(msg["ts"])):
+                            unchanged += 1
+                            continue
+                        
+                        processed_msg = format_message(msg, self._get_user_info(msg.get("user", "")))
                         # Add thread replies if they exist
                         if "thread_ts" in msg:
                             replies = self._get_thread_replies(channel_id, msg["thread_ts"])
@@ -46,17 +82,38 @@ class SlackIngest:
                         
                         processed_messages.append(processed_msg)
             
+            if unchanged:
+                logger.info(f"Skipped {unchanged} already indexed bug reports with unchanged threads")
             return processed_messages
         
         except SlackApiError as e:
             logger.error(f"Error fetching messages: {e}")
             return []
     
+    def get_thread(self, channel_id: str, thread_ts: str) -> Optional[Dict[str, Any]]:
+        """Fetch a thread's parent with its replies, or None if the parent is not a bug report"""
+        try:
+            result = self.client.conversations_replies(channel=channel_id, ts=thread_ts)
+            messages = result["messages"]
+            if not messages or not messages[0].get("text") or not is_bug_report(messages[0]["text"]):
+                return None
+            
+            parent = format_message(messages[0], self._get_user_info(messages[0].get("user", "")))
+            parent["replies"] = [
+                format_message(reply, self._get_user_info(reply.get("user", "")))
+                for reply in messages[1:]
+            ]
+            return parent
+        
+        except SlackApiError as e:
+            logger.error(f"Error fetching thread: {e}")
+            return None
+    
     def _get_user_info(self, user_id: str) -> Dict[str, str]:
         """Get user information for a given user ID"""
         try:
             if not user_id:
-                return {"name": "Unknown", "real_name": "Unknown User"}
+                return dict(UNKNOWN_USER)
             
             result = self.client.users_info(user=user_id)
             user = result["user"]
@@ -65,7 +122,7 @@ class SlackIngest:
                 "real_name": user.get("real_name", "Unknown User")
             }
         except SlackApiError:
-            return {"name": "Unknown", "real_name": "Unknown User"}
+            return dict(UNKNOWN_USER)
     
     def _get_thread_replies(self, channel_id: str, thread_ts: str) -> List[Dict[str, Any]]:
         """Get replies to a thread"""
@@ -79,12 +136,7 @@ class SlackIngest:
             
             processed_replies = []
             for reply in replies:
-                processed_reply = {
-                    "text": reply["text"],
-                    "ts": reply["ts"],
-                    "date": datetime.fromtimestamp(float(reply["ts"])).strftime('%Y-%m-%d %H:%M:%S'),
-                    "user": self._get_user_info(reply.get("user", ""))
-                }
+                processed_reply = format_message(reply, self._get_user_info(reply.get("user", "")))
                 processed_replies.append(processed_reply)
                 
             return processed_replies
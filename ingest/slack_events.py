@@ -0,0 +1,210 @@
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import EVENTS_BATCH_SIZE, EVENTS_FLUSH_INTERVAL
+from ingest.slack import is_bug_report, format_message
+
+logger = logging.getLogger(__name__)
+
+# Requests older than this are rejected to prevent replay attacks
+SIGNATURE_MAX_AGE = 60 * 5
+
+# Longest wait between retries of a batch whose write failed
+MAX_RETRY_BACKOFF = 60.0
+
+# Message subtypes that carry new or updated bug report content
+INDEXED_SUBTYPES = {None, "thread_broadcast", "file_share", "message_replied", "message_changed"}
+
+
+def verify_slack_signature(signing_secret: str, timestamp: str, body: bytes, signature: str,
+                           now: Optional[float] = None) -> bool:
+    """Check the X-Slack-Signature header against the raw request body"""
+    if not signing_secret or not timestamp or not signature:
+        return False
+    try:
+        if abs((now or time.time()) - int(timestamp)) > SIGNATURE_MAX_AGE:
+            return False
+    except ValueError:
+        return False
+
+    basestring = b"v0:" + timestamp.encode() + b":" + body
+    expected = "v0=" + hmac.new(signing_secret.encode(), basestring, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class WriteBehindQueue:
+    """Buffers Slack message events and flushes them to the vector store in batches.
+
+    A flush happens when EVENTS_BATCH_SIZE events are pending or when the
+    oldest pending event is EVENTS_FLUSH_INTERVAL seconds old, so embedding
+    stays batched while new reports become searchable within seconds.
+    Events for the same message or thread are coalesced within a batch.
+    """
+
+    def __init__(self, vector_store, extractor, max_batch_size: int = EVENTS_BATCH_SIZE,
+                 flush_interval: float = EVENTS_FLUSH_INTERVAL):
+        self.vector_store = vector_store
+        self.extractor = extractor
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        # (channel_id, ts) -> raw message, or None when the whole thread must be refetched
+        self._pending: Dict[Tuple[str, str], Optional[Dict[str, Any]]] = {}
+        self._oldest = None
+        # After a failed flush, nothing is flushed before this time; the wait doubles per failure
+        self._retry_at = 0.0
+        self._backoff = 0.0
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.events_received = 0
+        self.messages_indexed = 0
+        self.batches_flushed = 0
+        self.flush_failures = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="slack-events-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread after flushing whatever is pending"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    def handle_event(self, event: Dict[str, Any]):
+        """Queue a Slack `message` event. Unrelated events and subtypes are ignored."""
+        if event.get("type") != "message" or event.get("subtype") not in INDEXED_SUBTYPES:
+            return
+        channel_id = event.get("channel")
+        if not channel_id:
+            return
+
+        subtype = event.get("subtype")
+        if subtype in ("message_replied", "message_changed"):
+            # The updated message is nested. Replies, and edits of a thread parent, need
+            # the whole thread refetched: indexing the bare parent would drop its replies.
+            message = event.get("message", {})
+            thread_ts = message.get("thread_ts")
+            if subtype == "message_replied" or thread_ts or message.get("reply_count"):
+                self._put(channel_id, thread_ts or message.get("ts"), None)
+            elif message.get("ts"):
+                self._put(channel_id, message["ts"], message)
+        elif event.get("thread_ts") and event["thread_ts"] != event.get("ts"):
+            # A reply changes its parent's document
+            self._put(channel_id, event["thread_ts"], None)
+        elif event.get("ts"):
+            self._put(channel_id, event["ts"], event)
+
+    def _put(self, channel_id: str, ts: str, message: Optional[Dict[str, Any]]):
+        with self._condition:
+            self.events_received += 1
+            key = (channel_id, ts)
+            # A pending thread refetch already covers any newer copy of the parent
+            if key in self._pending and self._pending[key] is None:
+                message = None
+            self._pending[key] = message
+            if self._oldest is None:
+                self._oldest = time.time()
+            if len(self._pending) >= self.max_batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._due():
+                    timeout = self.flush_interval if self._oldest is None else \
+                        max(0.0, max(self._oldest + self.flush_interval, self._retry_at) - time.time())
+                    self._condition.wait(timeout)
+                if not self._running:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing Slack events, retrying in {self._backoff:.0f}s: {str(e)}")
+
+    def _due(self) -> bool:
+        if not self._pending or time.time() < self._retry_at:
+            return False
+        return len(self._pending) >= self.max_batch_size or time.time() - self._oldest >= self.flush_interval
+
+    def _take_batch(self) -> List[Tuple[Tuple[str, str], Optional[Dict[str, Any]]]]:
+        with self._condition:
+            batch = list(self._pending.items())
+            self._pending = {}
+            self._oldest = None
+        return batch
+
+    def _requeue(self, batch: List[Tuple[Tuple[str, str], Optional[Dict[str, Any]]]]):
+        """Put back events whose write failed, keeping any newer event for the same message"""
+        with self._condition:
+            for key, raw in batch:
+                if key not in self._pending:
+                    self._pending[key] = raw
+                elif raw is None:
+                    # The failed thread refetch also covers the newer copy of the parent
+                    self._pending[key] = None
+            if self._pending and self._oldest is None:
+                self._oldest = time.time()
+            self._backoff = min(MAX_RETRY_BACKOFF, max(self.flush_interval, self._backoff * 2))
+            self._retry_at = time.time() + self._backoff
+
+    def flush(self) -> int:
+        """Resolve pending events into documents and write them. Returns the number indexed.
+
+        Slack does not resend acknowledged events, so if a write fails the
+        unwritten events are queued again and retried with backoff.
+        """
+        batch = self._take_batch()
+        if not batch:
+            return 0
+
+        written = set()
+        indexed = 0
+        try:
+            by_channel: Dict[str, List[Dict[str, Any]]] = {}
+            for (channel_id, ts), raw in batch:
+                if raw is None:
+                    message = self.extractor.get_thread(channel_id, ts)
+                elif raw.get("text") and is_bug_report(raw["text"]):
+                    message = format_message(raw, self.extractor._get_user_info(raw.get("user", "")))
+                else:
+                    message = None
+                if message:
+                    by_channel.setdefault(channel_id, []).append(message)
+
+            for channel_id, messages in by_channel.items():
+                self.vector_store.add_messages(messages, channel_id)
+                written.add(channel_id)
+                indexed += len(messages)
+        except Exception:
+            self.messages_indexed += indexed
+            self.flush_failures += 1
+            self._requeue([(key, raw) for key, raw in batch if key[0] not in written])
+            raise
+
+        with self._condition:
+            self._backoff = 0.0
+            self._retry_at = 0.0
+        self.messages_indexed += indexed
+        self.batches_flushed += 1
+        logger.info(f"Flushed {len(batch)} Slack events, indexed {indexed} bug reports")
+        return indexed
+
+    def status(self) -> Dict[str, Any]:
+        with self._condition:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "events_received": self.events_received,
+            "messages_indexed": self.messages_indexed,
+            "batches_flushed": self.batches_flushed,
+            "flush_failures": self.flush_failures
+        }
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import posixpath
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from config import EXPORT_BATCH_SIZE, EXPORT_WORKERS
+from ingest.slack import UNKNOWN_USER, is_bug_report, format_message
+
+logger = logging.getLogger(__name__)
+
+# Channel listings bundled in a workspace export. Public channel folders are
+# named after the channel, private and DM folders after the conversation id.
+CHANNEL_LISTINGS = ["channels.json", "groups.json", "mpims.json", "dms.json"]
+
+# Per-process state for the parsing workers
+_worker_zip = None
+_worker_users = None
+
+
+def _init_worker(zip_path: str, users: Dict[str, Dict[str, str]]):
+    global _worker_zip, _worker_users
+    _worker_zip = zipfile.ZipFile(zip_path)
+    _worker_users = users
+
+
+def _resolve_user(msg: Dict[str, Any]) -> Dict[str, str]:
+    user = _worker_users.get(msg.get("user", ""))
+    if user:
+        return user
+    # Bot and integration messages carry their own display name
+    profile = msg.get("user_profile") or {}
+    name = profile.get("name") or msg.get("username")
+    if name:
+        return {"name": name, "real_name": profile.get("real_name") or name}
+    return dict(UNKNOWN_USER)
+
+
+def _parse_day_file(member: str) -> Tuple[List[Dict[str, Any]], Dict[str, List[Dict[str, Any]]]]:
+    """Parse one channel-day file into bug report parents and thread replies keyed by thread_ts"""
+    with _worker_zip.open(member) as f:
+        raw_messages = json.load(f)
+
+    parents = []
+    replies = defaultdict(list)
+    for msg in raw_messages:
+        if msg.get("type", "message") != "message" or not msg.get("text") or "ts" not in msg:
+            continue
+
+        thread_ts = msg.get("thread_ts")
+        if thread_ts and thread_ts != msg["ts"]:
+            # Reply in a thread; broadcast replies also appear in the channel but
+            # are indexed as part of their parent thread only
+            replies[thread_ts].append(format_message(msg, _resolve_user(msg)))
+        elif is_bug_report(msg["text"]):
+            processed_msg = format_message(msg, _resolve_user(msg))
+            if thread_ts:
+                processed_msg["thread_ts"] = thread_ts
+            parents.append(processed_msg)
+
+    return parents, dict(replies)
+
+
+class SlackExportIngest:
+    """Reads bug reports from a Slack workspace export ZIP without calling the Slack API"""
+
+    def __init__(self, zip_path: str, workers: int = EXPORT_WORKERS):
+        self.zip_path = zip_path
+        self.workers = workers or os.cpu_count() or 1
+        with zipfile.ZipFile(zip_path) as zf:
+            self._members = zf.namelist()
+            self.users = self._load_users(zf)
+            self.channel_ids = self._load_channel_ids(zf)
+
+    def _load_users(self, zf: zipfile.ZipFile) -> Dict[str, Dict[str, str]]:
+        if "users.json" not in self._members:
+            logger.warning("Export has no users.json; reporters will be shown as unknown")
+            return {}
+        users = {}
+        for user in json.loads(zf.read("users.json")):
+            users[user["id"]] = {
+                "name": user.get("name", "Unknown"),
+                "real_name": user.get("real_name") or user.get("profile", {}).get("real_name", "Unknown User")
+            }
+        return users
+
+    def _load_channel_ids(self, zf: zipfile.ZipFile) -> Dict[str, str]:
+        """Map export folder names to channel ids"""
+        channel_ids = {}
+        for listing in CHANNEL_LISTINGS:
+            if listing not in self._members:
+                continue
+            for channel in json.loads(zf.read(listing)):
+                channel_ids[channel.get("name") or channel["id"]] = channel["id"]
+        return channel_ids
+
+    def get_channels(self) -> List[Dict[str, Any]]:
+        """Channels present in the export, in the same shape as SlackIngest.get_channels"""
+        folders = sorted({posixpath.dirname(m) for m in self._members if posixpath.dirname(m)})
+        return [
+            {"id": self.channel_ids.get(folder, folder), "name": folder, "is_archived": False}
+            for folder in folders
+        ]
+
+    def _day_files(self, folder: str) -> List[str]:
+        return sorted(
+            m for m in self._members
+            if posixpath.dirname(m) == folder and m.endswith(".json")
+        )
+
+    def iter_batches(self, channels: Optional[List[str]] = None,
+                     batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+        """Yield (channel_id, messages) batches ready for VectorStore.add_messages.
+
+        Day files are parsed in parallel worker processes. Channels are handled
+        one at a time because a thread's replies can land in later day files, so
+        memory is bounded by the largest channel rather than the whole export.
+        """
+        selected = [
+            c for c in self.get_channels()
+            if not channels or c["id"] in channels or c["name"] in channels
+        ]
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.zip_path, self.users)
+        ) as executor:
+            for channel in selected:
+                parents = []
+                replies = defaultdict(list)
+                for day_parents, day_replies in executor.map(_parse_day_file, self._day_files(channel["name"]), chunksize=8):
+                    parents.extend(day_parents)
+                    for thread_ts, thread_replies in day_replies.items():
+                        replies[thread_ts].extend(thread_replies)
+
+                # Rebuild threads from thread_ts
+                for msg in parents:
+                    thread_ts = msg.pop("thread_ts", None)
+                    if thread_ts and thread_ts in replies:
+                        msg["replies"] = sorted(replies[thread_ts], key=lambda r: float(r["ts"]))
+
+                logger.info(f"Found {len(parents)} bug reports in channel {channel['name']}")
+                for i in range(0, len(parents), batch_size):
+                    yield channel["id"], parents[i:i + batch_size]
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, Optional, Tuple
+
+from config import LLM_MAX_CONCURRENT, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT
+from llm.ollama import LLMTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class LLMOverloadedError(Exception):
+    """Raised when the LLM wait queue is full or a queued request waited too long"""
+
+
+class AdmissionControlledLLM:
+    """Bounded-concurrency front for an LLM client with request coalescing.
+
+    At most max_concurrent generations run at once and at most max_queue more
+    wait for a slot; anything beyond that is shed with LLMOverloadedError.
+    Concurrent calls with the same prompt inputs share a single generation
+    (singleflight) and do not take extra slots, as long as that generation's
+    time budget lasts at least as long as the caller's. A per-call timeout
+    bounds the wait for a slot plus the generation itself (see LLMTimeoutError).
+    """
+
+    def __init__(self, llm, max_concurrent: int = LLM_MAX_CONCURRENT, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.llm = llm
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        # Prompt key -> (shared generation, monotonic time its budget runs out or None)
+        self._inflight: Dict[str, Tuple[Future, Optional[float]]] = {}
+        self._active = 0
+        self._waiting = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.shed = 0
+
+    def __getattr__(self, name):
+        # Expose model, base_url etc. of the wrapped client
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def generate_response(self, query: str, context: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        return self._call("generate_response", query, context, timeout)
+
+    def generate_response_advanced(self, query: str, context_results: Dict[str, Any],
+                                   timeout: Optional[float] = None) -> str:
+        return self._call("generate_response_advanced", query, context_results, timeout)
+
+    def _key(self, method: str, query: str, context: Dict[str, Any]) -> str:
+        """Identical prompts come from the same method, query and retrieved documents"""
+        documents = context.get("documents") if isinstance(context, dict) else None
+        raw = json.dumps([method, query, documents], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _call(self, method: str, query: str, context: Dict[str, Any], timeout: Optional[float] = None) -> str:
+        key = self._key(method, query, context)
+        expires_at = None if timeout is None else time.monotonic() + timeout
+        leader = False
+
+        with self._lock:
+            flight, flight_expires_at = self._inflight.get(key, (None, None))
+            # A generation cut off by a tighter budget than the caller's would cut the caller off too
+            if flight is not None and (
+                flight_expires_at is None or (expires_at is not None and flight_expires_at >= expires_at)
+            ):
+                self.coalesced += 1
+            elif self._active + self._waiting >= self.max_concurrent + self.max_queue:
+                self.shed += 1
+                raise LLMOverloadedError(
+                    f"LLM queue is full ({self._active} running, {self._waiting} waiting)"
+                )
+            else:
+                # Later callers share this generation, which outlives the one it replaces
+                flight = Future()
+                self._inflight[key] = (flight, expires_at)
+                self._waiting += 1
+                leader = True
+
+        if leader:
+            return self._lead(key, flight, method, query, context, timeout)
+        # Share the generation already running for this prompt
+        try:
+            return flight.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise LLMTimeoutError(f"Timed out after {timeout:.2f}s waiting for a shared generation")
+
+    def _lead(self, key: str, flight: Future, method: str, query: str, context: Dict[str, Any],
+              timeout: Optional[float] = None) -> str:
+        """Wait for a slot, run the generation and publish the result to coalesced callers"""
+        try:
+            started = time.monotonic()
+            wait = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+            acquired = self._slots.acquire(timeout=wait)
+            with self._lock:
+                self._waiting -= 1
+                if acquired:
+                    self._active += 1
+                elif wait == self.queue_timeout:
+                    self.shed += 1
+            if not acquired:
+                if wait < self.queue_timeout:
+                    raise LLMTimeoutError(f"Time ran out after {wait:.2f}s waiting for an LLM slot")
+                raise LLMOverloadedError(f"Timed out after {self.queue_timeout}s waiting for an LLM slot")
+
+            try:
+                if timeout is None:
+                    result = getattr(self.llm, method)(query, context)
+                else:
+                    remaining = timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise LLMTimeoutError(f"Time ran out after {timeout:.2f}s waiting for an LLM slot")
+                    result = getattr(self.llm, method)(query, context, timeout=remaining)
+            finally:
+                self._slots.release()
+                with self._lock:
+                    self._active -= 1
+                    self.completed += 1
+
+            flight.set_result(result)
+            return result
+
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+
+        finally:
+            with self._lock:
+                if self._inflight.get(key, (None, None))[0] is flight:
+                    del self._inflight[key]
+
+    def status(self) -> Dict[str, Any]:
+        """Queue depth and admission counters"""
+        with self._lock:
+            return {
+                "running": self._active,
+                "queue_depth": self._waiting,
+                "in_flight_prompts": len(self._inflight),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "coalesced": self.coalesced,
+                "shed": self.shed
+            }
@@ -1,16 +1,28 @@
 import requests
 import json
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 
 from config import OLLAMA_BASE_URL, OLLAMA_MODEL
 
+class LLMTimeoutError(Exception):
+    """Raised when a generation runs past its time limit. partial holds the text produced before the cut-off."""
+    
+    def __init__(self, message: str, partial: str = ""):
+        super().__init__(message)
+        self.partial = partial
+
 class OllamaLLM:
     def __init__(self):
         self.base_url = OLLAMA_BASE_URL
         self.model = OLLAMA_MODEL
     
-    def generate_response(self, query: str, context: List[Dict[str, Any]]) -> str:
-        """Generate a response using Ollama with RAG context"""
+    def generate_response(self, query: str, context: List[Dict[str, Any]], timeout: Optional[float] = None) -> str:
+        """Generate a response using Ollama with RAG context.
+        
+        With a timeout (seconds) the generation is streamed and cut off when
+        the time runs out, raising LLMTimeoutError with the partial text.
+        """
         
         # Format context for the prompt
         formatted_context = self._format_context(context)
@@ -31,16 +43,20 @@ Please provide:
 3. Any additional context that might be helpful
 """
         
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False
+        }
+        if timeout is not None:
+            return self._generate_until(payload, timeout)
+        
         # Call Ollama API
         try:
             response = requests.post(
                 f"{self.base_url}/api/generate",
                 headers={"Content-Type": "application/json"},
-                data=json.dumps({
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False
-                })
+                data=json.dumps(payload)
             )
             
             if response.status_code == 200:
@@ -52,6 +68,44 @@ Please provide:
         except Exception as e:
             return f"Error connecting to Ollama: {str(e)}"
     
+    def _generate_until(self, payload: Dict[str, Any], timeout: float) -> str:
+        """Stream a generation and stop reading once timeout seconds have passed"""
+        deadline = time.monotonic() + timeout
+        chunks = []
+        streaming = False
+        try:
+            # Leaving the with block closes the connection, which makes Ollama abandon the generation
+            with requests.post(
+                f"{self.base_url}/api/generate",
+                headers={"Content-Type": "application/json"},
+                data=json.dumps(dict(payload, stream=True)),
+                stream=True,
+                timeout=max(0.001, timeout)
+            ) as response:
+                if response.status_code != 200:
+                    return f"Error: Unable to get response from Ollama (Status code: {response.status_code})"
+                streaming = True
+                for line in response.iter_lines():
+                    if line:
+                        part = json.loads(line)
+                        chunks.append(part.get("response", ""))
+                        if part.get("done"):
+                            return "".join(chunks)
+                    if time.monotonic() >= deadline:
+                        break
+        except requests.exceptions.Timeout:
+            pass
+        except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            # Read timeouts mid-stream surface as ConnectionError too. Once the answer
+            # is streaming, hand back what was generated so far.
+            if not streaming:
+                return f"Error connecting to Ollama: {str(e)}"
+            raise LLMTimeoutError(f"Generation stream broke off: {e}", partial="".join(chunks))
+        except Exception as e:
+            return f"Error connecting to Ollama: {str(e)}"
+        
+        raise LLMTimeoutError(f"Generation cut off after {timeout:.2f}s", partial="".join(chunks))
+    
     def _format_context(self, context_results: List[Dict[str, Any]]) -> str:
         """Format the retrieved context for the prompt"""
         if not context_results:
@@ -66,8 +120,9 @@ Please provide:
         
         return formatted_text 
     
-    def generate_response_advanced(self, query: str, context_results: Dict[str, Any]) -> str:
-        """Generate response with advanced context handling"""
+    def generate_response_advanced(self, query: str, context_results: Dict[str, Any],
+                                   timeout: Optional[float] = None) -> str:
+        """Generate response with advanced context handling. timeout works as in generate_response."""
         prompt = f"""You are analyzing bug reports from a software development team. Your task is to find patterns, similarities, and potential solutions based on historical data.
 
         NEW BUG REPORT:
@@ -98,19 +153,23 @@ Please provide:
         Format your response clearly with these sections.
         """
 
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {
+                "temperature": 0.1,  # Lower temperature for more factual responses
+                "top_p": 0.9
+            }
+        }
+        if timeout is not None:
+            return self._generate_until(payload, timeout)
+
         try:
             response = requests.post(
                 f"{self.base_url}/api/generate",
                 headers={"Content-Type": "application/json"},
-                data=json.dumps({
-                    "model": self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.1,  # Lower temperature for more factual responses
-                        "top_p": 0.9
-                    }
-                })
+                data=json.dumps(payload)
             )
             
             if response.status_code == 200:
@@ -1,8 +1,23 @@
 import argparse
+import json
 import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from ingest.slack import SlackIngest
-from rag.vector_store_minilm import MiniLmVectorStore
+from ingest.slack_export import SlackExportIngest
+from ingest.slack_events import WriteBehindQueue
+from rag.store_factory import create_vector_store
+from rag.snapshot import save_snapshot, restore_snapshot
+from rag.model_registry import model_registry
+from rag.vector_store import format_results
+from rag.reduction import PCA, MATRYOSHKA, evaluate_dimensions
+from rag.migration import acquire_maintenance_lock
+from rag.files import atomic_write
 from llm.ollama import OllamaLLM
+from config import EMBEDDING_SERVICE_SOCKET, BATCH_SEARCH_SIZE, BATCH_LLM_WORKERS, EMBEDDING_REDUCTION, SNAPSHOT_BATCH_SIZE
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -10,7 +25,7 @@ logger = logging.getLogger(__name__)
 def ingest_data(channels=None):
     """Ingest data from Slack channels"""
     extractor = SlackIngest()
-    vector_store = MiniLmVectorStore()
+    vector_store = create_vector_store()
     
     # Get channels if not specified
     if not channels:
@@ -19,15 +34,48 @@ def ingest_data(channels=None):
     
     for channel_id in channels:
         logger.info(f"Processing channel: {channel_id}")
-        messages = extractor.get_messages(channel_id)
+        # Only threads that changed since they were indexed are fetched and re-embedded
+        messages = extractor.get_messages(channel_id, indexed_threads=vector_store.get_thread_states(channel_id))
         logger.info(f"Found {len(messages)} bug reports in channel")
         vector_store.add_messages(messages, channel_id)
     
     logger.info("Data ingestion complete")
 
+def ingest_export(zip_path, channels=None):
+    """Ingest data from a Slack workspace export ZIP without calling the Slack API"""
+    extractor = SlackExportIngest(zip_path)
+    vector_store = create_vector_store()
+    
+    total_messages = 0
+    for channel_id, messages in extractor.iter_batches(channels):
+        vector_store.add_messages(messages, channel_id)
+        total_messages += len(messages)
+    
+    logger.info(f"Export ingestion complete. Indexed {total_messages} bug reports")
+
+def replay_events(path):
+    """Feed recorded Slack Events API payloads through the write-behind queue"""
+    with open(path) as f:
+        content = f.read().strip()
+    # Accept a JSON array, a single payload or one payload per line
+    if content.startswith("["):
+        payloads = json.loads(content)
+    elif "\n" in content:
+        payloads = [json.loads(line) for line in content.splitlines() if line.strip()]
+    else:
+        payloads = [json.loads(content)]
+    
+    queue = WriteBehindQueue(create_vector_store(), SlackIngest())
+    for payload in payloads:
+        if payload.get("type") == "event_callback":
+            queue.handle_event(payload.get("event", {}))
+    queue.flush()
+    
+    logger.info(f"Replayed {len(payloads)} payloads: {queue.status()}")
+
 def search_similar_bugs(query):
     """Search for similar bug reports"""
-    vector_store = MiniLmVectorStore()
+    vector_store = create_vector_store()
     ollama = OllamaLLM()
     
     logger.info(f"Searching for similar bug reports to: {query}")
@@ -40,6 +88,248 @@ def search_similar_bugs(query):
     
     return response
 
+def _read_queries(path, skip=0):
+    """Yield (line number, id, query) from a JSONL/plain-text file or stdin ("-")"""
+    f = sys.stdin if path == "-" else open(path)
+    try:
+        for line_no, line in enumerate(f):
+            if line_no < skip or not line.strip():
+                continue
+            line = line.strip()
+            # Lines are {"query": ..., "id": ...} objects or raw query text
+            record = json.loads(line) if line.startswith("{") else {"query": line}
+            yield line_no, record.get("id", line_no), record["query"]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def _load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return json.load(f)["completed"]
+
+def _save_checkpoint(path, completed):
+    with atomic_write(path) as f:
+        json.dump({"completed": completed}, f)
+
+def _analyze(llm, query, results):
+    try:
+        return {"analysis": llm.generate_response(query, results)}
+    except Exception as e:
+        logger.error(f"LLM analysis failed for {query!r}: {str(e)}")
+        return {"analysis": None, "error": str(e)}
+
+def batch_search(input_path, output_path, batch_size=BATCH_SEARCH_SIZE, max_results=3, diversity=0.0,
+                 llm_workers=BATCH_LLM_WORKERS, use_llm=True, checkpoint=None):
+    """Search many queries, writing one JSON result per line in input order.
+    
+    Queries are encoded batch_size at a time. LLM analyses run on llm_workers
+    threads while the next batch is retrieved, and results are written as soon
+    as every earlier query has finished. With a checkpoint the run can be
+    interrupted and resumed without repeating completed queries.
+    """
+    vector_store = create_vector_store()
+    model_registry.preload(vector_store.model_specs())
+    llm = OllamaLLM() if use_llm else None
+    executor = ThreadPoolExecutor(max_workers=max(1, llm_workers)) if use_llm else None
+    
+    completed = _load_checkpoint(checkpoint)
+    if completed:
+        logger.info(f"Resuming after {completed} input lines")
+    if output_path == "-":
+        out = sys.stdout
+    else:
+        out = open(output_path, "a" if completed else "w")
+    
+    # (line number, record, pending analysis) in input order
+    pending = deque()
+    written = 0
+    
+    # Bound on how far retrieval runs ahead of the LLM
+    max_pending = batch_size + max(1, llm_workers) * 4
+    
+    def drain(limit=None):
+        """Write finished results in order, waiting on the oldest while more than limit are pending"""
+        nonlocal completed, written
+        while pending and (
+            (limit is not None and len(pending) > limit)
+            or pending[0][2] is None
+            or pending[0][2].done()
+        ):
+            line_no, record, analysis = pending.popleft()
+            if analysis is not None:
+                record.update(analysis.result())
+            out.write(json.dumps(record, default=str) + "\n")
+            completed = line_no + 1
+            written += 1
+        out.flush()
+        if checkpoint:
+            _save_checkpoint(checkpoint, completed)
+    
+    def run_batch(batch):
+        queries = [query for _, _, query in batch]
+        for (line_no, query_id, query), results in zip(batch, vector_store.search_batch(queries, max_results, diversity)):
+            record = {"id": query_id, "query": query, "similar_reports": format_results(results)}
+            analysis = executor.submit(_analyze, llm, query, results) if use_llm else None
+            pending.append((line_no, record, analysis))
+        drain(max_pending)
+    
+    try:
+        batch = []
+        for item in _read_queries(input_path, skip=completed):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                run_batch(batch)
+                batch = []
+        if batch:
+            run_batch(batch)
+        drain(0)
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if out is not sys.stdout:
+            out.close()
+    
+    logger.info(f"Batch search complete. Wrote {written} results")
+
+def run_repl(max_results=3, use_llm=True):
+    """Interactive search that keeps the models loaded between queries"""
+    vector_store = create_vector_store()
+    logger.info("Loading models...")
+    model_registry.preload(vector_store.model_specs())
+    llm = OllamaLLM()
+    diversity = 0.0
+    
+    print("Enter a bug report to search. Commands: :k N, :diversity X, :llm on|off, :quit")
+    while True:
+        try:
+            line = input("search> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            return
+        if not line:
+            continue
+        
+        if line.startswith(":"):
+            command, _, value = line[1:].partition(" ")
+            try:
+                if command in ("q", "quit", "exit"):
+                    return
+                elif command == "k":
+                    max_results = int(value)
+                elif command == "diversity":
+                    diversity = float(value)
+                elif command == "llm":
+                    use_llm = value.strip() != "off"
+                else:
+                    print(f"Unknown command: {command}")
+            except ValueError:
+                print(f"Invalid value for :{command}: {value}")
+            continue
+        
+        try:
+            results = vector_store.search(line, max_results, diversity=diversity)
+        except Exception as e:
+            print(f"Search failed: {str(e)}")
+            continue
+        for i, report in enumerate(format_results(results), 1):
+            metadata = report["metadata"] or {}
+            print(f"\n[{i}] score={report['score']:.4f} {metadata.get('date', '')} {metadata.get('user', '')}")
+            print(report["document"][:500])
+        if use_llm:
+            print("\nAnalysis:\n")
+            print(_analyze(llm, line, results).get("analysis") or "(LLM unavailable)")
+        print()
+
+def _require_maintenance_lock():
+    if not acquire_maintenance_lock():
+        raise SystemExit("The API server or another command is maintaining this index; stop it first")
+
+def migrate_embeddings():
+    """Re-embed the index with the configured embedding model"""
+    _require_maintenance_lock()
+    vector_store = create_vector_store()
+    
+    if not vector_store.needs_migration():
+        logger.info(f"Index already uses {vector_store.embedding_model_name}, nothing to migrate")
+        return
+    
+    migration = vector_store.start_migration(background=False)
+    if migration is None:
+        return
+    logger.info(f"Migration {migration.state}: {migration.migrated}/{migration.total} documents")
+
+def snapshot_index(path):
+    """Write the index to a snapshot archive"""
+    vector_store = create_vector_store()
+    manifest = save_snapshot(vector_store, path)
+    logger.info(f"Snapshot of {manifest['count']} documents ({manifest['embedding_model']}) written to {path}")
+
+def restore_index(path):
+    """Load the index from a snapshot archive without re-encoding"""
+    _require_maintenance_lock()
+    vector_store = create_vector_store()
+    manifest = restore_snapshot(vector_store, path)
+    logger.info(f"Restored {manifest['count']} documents ({manifest['embedding_model']}) from {path}")
+    if vector_store.needs_migration():
+        logger.info("Snapshot model or reduction differs from the configuration; run 'migrate' to re-embed")
+
+def evaluate_reduction(method, dimensions, k=10, queries_path=None, sample=500, limit=None):
+    """Report recall@k, vector memory and search latency of the index at reduced dimensions"""
+    vector_store = create_vector_store()
+    index = vector_store._index
+    model = model_registry.get_embedding_model(index.model_name)
+    total = index.collection.count() if limit is None else min(limit, index.collection.count())
+    
+    # Full-dimension corpus embeddings: stored ones if the index is unreduced, else re-encoded
+    include = ["embeddings"] if not index.reduction else ["documents"]
+    batches = []
+    for offset in range(0, total, SNAPSHOT_BATCH_SIZE):
+        batch = index.collection.get(limit=min(SNAPSHOT_BATCH_SIZE, total - offset), offset=offset, include=include)
+        batches.append(np.asarray(batch["embeddings"]) if not index.reduction else model.encode(batch["documents"]))
+    if not batches:
+        logger.info("The index is empty, nothing to evaluate")
+        return
+    corpus = np.vstack(batches).astype(np.float32)
+    
+    if queries_path:
+        queries = model.encode([query for _, _, query in _read_queries(queries_path)])
+        query_rows = None
+    else:
+        # Use a sample of indexed reports as queries
+        query_rows = np.random.default_rng(0).choice(len(corpus), size=min(sample, len(corpus)), replace=False)
+        queries = corpus[query_rows]
+    
+    # PCA cannot fit more components than there are documents; truncation only needs a smaller dimension
+    full_dimension = corpus.shape[1]
+    max_dimension = (min(len(corpus), full_dimension) if method == PCA else full_dimension) - 1
+    skipped = sorted(d for d in dimensions if d > max_dimension)
+    dimensions = [d for d in dimensions if 0 < d <= max_dimension]
+    if skipped:
+        logger.warning(
+            f"Skipping dimensions {skipped}: {method} on {len(corpus)} documents of dimension "
+            f"{full_dimension} supports at most {max_dimension}"
+        )
+    if not dimensions:
+        print(f"No dimension to evaluate below {max_dimension + 1}. Pass smaller --dims or index more documents.")
+        return
+    rows = evaluate_dimensions(corpus, queries, method, dimensions, k=k, query_rows=query_rows)
+    
+    print(f"\n{index.model_name}, {method}, {len(corpus)} documents, {len(queries)} queries\n")
+    print(f"{'dimension':>9}  {'recall@' + str(k):>9}  {'vectors MB':>10}  {'query ms':>8}")
+    for row in rows:
+        print(f"{row['dimension']:>9}  {row['recall_at_k']:>9.3f}  {row['vectors_mb']:>10.2f}  {row['query_ms']:>8.3f}")
+
+def run_embedding_service(socket_path):
+    """Run the shared embedding/rerank service that API workers connect to"""
+    from rag.embedding_service import EmbeddingService
+    from rag.model_registry import EMBEDDING
+    from config import EMBEDDING_MODEL
+    
+    service = EmbeddingService(socket_path)
+    service.serve_forever(preload=[(EMBEDDING, EMBEDDING_MODEL)])
+
 def main():
     parser = argparse.ArgumentParser(description="Slack Bug Reports RAG System")
     subparsers = parser.add_subparsers(dest="command", help="Command to run")
@@ -48,18 +338,89 @@ def main():
     ingest_parser = subparsers.add_parser("ingest", help="Ingest data from Slack")
     ingest_parser.add_argument("--channels", nargs="+", help="Channel IDs to process")
     
+    # Ingest export command
+    export_parser = subparsers.add_parser("ingest-export", help="Ingest data from a Slack export ZIP")
+    export_parser.add_argument("path", help="Path to the Slack export ZIP")
+    export_parser.add_argument("--channels", nargs="+", help="Channel IDs or names to process")
+    
+    # Replay events command
+    replay_parser = subparsers.add_parser("replay-events", help="Index recorded Slack Events API payloads")
+    replay_parser.add_argument("path", help="JSON or JSONL file of event payloads")
+    
+    # Embedding service command
+    service_parser = subparsers.add_parser("embedding-service", help="Run the shared embedding service")
+    service_parser.add_argument("--socket", default=EMBEDDING_SERVICE_SOCKET or "/tmp/embedding_service.sock",
+                                help="Unix socket path to listen on")
+    
     # Search command
     search_parser = subparsers.add_parser("search", help="Search for similar bug reports")
     search_parser.add_argument("query", help="Bug report query to search for")
     
+    # Batch search command
+    batch_parser = subparsers.add_parser("batch", help="Search many queries from a JSONL file or stdin")
+    batch_parser.add_argument("--input", default="-", help="JSONL or one-query-per-line file, '-' for stdin")
+    batch_parser.add_argument("--output", default="-", help="JSONL results file, '-' for stdout")
+    batch_parser.add_argument("--batch-size", type=int, default=BATCH_SEARCH_SIZE, help="Queries encoded per model call")
+    batch_parser.add_argument("--max-results", type=int, default=3, help="Similar reports per query")
+    batch_parser.add_argument("--diversity", type=float, default=0.0, help="MMR diversity between 0 and 1")
+    batch_parser.add_argument("--llm-workers", type=int, default=BATCH_LLM_WORKERS, help="Concurrent LLM analyses")
+    batch_parser.add_argument("--no-llm", action="store_true", help="Only retrieve similar reports")
+    batch_parser.add_argument("--checkpoint", help="File recording progress so an interrupted run can resume")
+    
+    # Interactive search command
+    repl_parser = subparsers.add_parser("repl", help="Interactive search with the models kept loaded")
+    repl_parser.add_argument("--max-results", type=int, default=3, help="Similar reports per query")
+    repl_parser.add_argument("--no-llm", action="store_true", help="Only retrieve similar reports")
+    
+    # Migrate command
+    subparsers.add_parser("migrate", help="Re-embed the index with the configured embedding model")
+    
+    # Dimension reduction evaluation command
+    eval_parser = subparsers.add_parser("eval-dims", help="Compare recall, memory and latency at reduced dimensions")
+    eval_parser.add_argument("--method", choices=[PCA, MATRYOSHKA], default=EMBEDDING_REDUCTION or PCA,
+                             help="Reduction to evaluate")
+    eval_parser.add_argument("--dims", type=int, nargs="+", default=[64, 128, 256, 384, 512],
+                             help="Target dimensions")
+    eval_parser.add_argument("--k", type=int, default=10, help="Neighbours compared for recall@k")
+    eval_parser.add_argument("--queries", help="JSONL or one-query-per-line file; defaults to sampled indexed reports")
+    eval_parser.add_argument("--sample", type=int, default=500, help="Indexed reports used as queries without --queries")
+    eval_parser.add_argument("--limit", type=int, help="Evaluate on at most this many indexed documents")
+    
+    # Snapshot commands
+    snapshot_parser = subparsers.add_parser("snapshot", help="Write the index to a snapshot archive")
+    snapshot_parser.add_argument("path", help="Snapshot file to write")
+    restore_parser = subparsers.add_parser("restore", help="Load the index from a snapshot archive")
+    restore_parser.add_argument("path", help="Snapshot file to read")
+    
     args = parser.parse_args()
     
     if args.command == "ingest":
         ingest_data(args.channels)
+    elif args.command == "ingest-export":
+        ingest_export(args.path, args.channels)
+    elif args.command == "embedding-service":
+        run_embedding_service(args.socket)
+    elif args.command == "replay-events":
+        replay_events(args.path)
     elif args.command == "search":
         response = search_similar_bugs(args.query)
         print("\nGenerated Response:\n")
         print(response)
+    elif args.command == "batch":
+        batch_search(args.input, args.output, batch_size=args.batch_size, max_results=args.max_results,
+                     diversity=args.diversity, llm_workers=args.llm_workers, use_llm=not args.no_llm,
+                     checkpoint=args.checkpoint)
+    elif args.command == "repl":
+        run_repl(args.max_results, use_llm=not args.no_llm)
+    elif args.command == "migrate":
+        migrate_embeddings()
+    elif args.command == "eval-dims":
+        evaluate_reduction(args.method, args.dims, k=args.k, queries_path=args.queries,
+                           sample=args.sample, limit=args.limit)
+    elif args.command == "snapshot":
+        snapshot_index(args.path)
+    elif args.command == "restore":
+        restore_index(args.path)
     else:
         parser.print_help()
 
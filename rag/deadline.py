@@ -0,0 +1,49 @@
+import time
+from typing import List, Optional
+
+
+class Deadline:
+    """Latency budget for one request, passed down to every search stage.
+
+    Stages ask how much work fits in the time that is left and record in
+    `degraded` when they had to cut their work short.
+    """
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+        self.degraded: List[str] = []
+
+    @classmethod
+    def from_ms(cls, budget_ms: Optional[float]) -> Optional["Deadline"]:
+        """A Deadline for a positive budget, None for no budget"""
+        return cls(budget_ms) if budget_ms and budget_ms > 0 else None
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def fit(self, wanted: int, seconds_per_item: float, share: float = 1.0) -> int:
+        """How many of `wanted` items a stage can process in `share` of the remaining time"""
+        if seconds_per_item <= 0:
+            return wanted
+        return max(0, min(wanted, int(self.remaining() * share / seconds_per_item)))
+
+    def degrade(self, stage: str):
+        if stage not in self.degraded:
+            self.degraded.append(stage)
+
+
+class StageCost:
+    """Running estimate of the seconds a stage spends per item, used to size work to a Deadline"""
+
+    def __init__(self, initial_seconds_per_item: float, smoothing: float = 0.2):
+        self.per_item = initial_seconds_per_item
+        self.smoothing = smoothing
+
+    def observe(self, items: int, seconds: float):
+        if items > 0:
+            self.per_item += self.smoothing * (seconds / items - self.per_item)
@@ -0,0 +1,299 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import DEDUP_NUM_PERM, DEDUP_BANDS, DEDUP_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime used as the modulus of the MinHash permutations
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_SHINGLE_SIZE = 3
+
+
+def _shingles(text: str) -> List[str]:
+    """Word 3-grams of the normalised text"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + _SHINGLE_SIZE]) for i in range(len(words) - _SHINGLE_SIZE + 1)]
+
+
+class MinHasher:
+    """Computes MinHash signatures with seeded random linear permutations"""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # Coefficients below 2^31 and 32-bit shingle hashes keep a*x + b inside uint64
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array([zlib.crc32(s.encode()) for s in set(_shingles(text))], dtype=np.uint64)
+        # One (shingles x permutations) matrix op instead of a loop per permutation
+        return ((np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+
+class NearDuplicateIndex:
+    """Persistent MinHash-LSH index mapping near-duplicate messages to a canonical document.
+
+    Signatures are split into bands; documents sharing any band bucket are
+    candidates, and a candidate is a duplicate when the estimated Jaccard
+    similarity of the signatures reaches the threshold.
+
+    classify() only reads the database and keeps new rows in memory; commit()
+    writes them in one short transaction. Other processes sharing the file are
+    therefore never blocked while a batch is being embedded.
+    """
+
+    def __init__(self, path: str, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS,
+                 threshold: float = DEDUP_THRESHOLD):
+        if num_perm % bands != 0:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be divisible by DEDUP_BANDS ({bands})")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        # Rows classified but not yet committed: doc_id -> signatures row, band bucket -> doc_ids,
+        # and doc_id -> new thread state of an already registered message
+        self._pending_signatures: Dict[str, Tuple] = {}
+        self._pending_bands: Dict[Tuple[int, int], List[str]] = {}
+        self._pending_states: Dict[str, Tuple] = {}
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL lets readers in other processes proceed while one of them commits
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS signatures (
+                doc_id TEXT PRIMARY KEY,
+                canonical_id TEXT NOT NULL,
+                channel_id TEXT,
+                length INTEGER NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                doc_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_lookup ON bands (band, bucket);
+            CREATE INDEX IF NOT EXISTS signatures_canonical ON signatures (canonical_id);
+        """)
+        # Thread state of collapsed messages, so unchanged threads are not refetched on ingest.
+        # Added after the table was first released, hence the upgrade in place.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(signatures)")}
+        for column, definition in (("ts", "TEXT"), ("reply_count", "INTEGER DEFAULT 0"), ("latest_reply", "TEXT DEFAULT ''")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE signatures ADD COLUMN {column} {definition}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS signatures_channel ON signatures (channel_id)")
+        self._conn.commit()
+
+    def _buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        buckets = []
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            bucket = int.from_bytes(hashlib.md5(chunk).digest()[:8], "big", signed=True)
+            buckets.append((band, bucket))
+        return buckets
+
+    def _find_canonical(self, signature: np.ndarray, buckets: List[Tuple[int, int]]) -> Optional[str]:
+        candidates = set()
+        for band, bucket in buckets:
+            rows = self._conn.execute(
+                "SELECT doc_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+            ).fetchall()
+            candidates.update(row[0] for row in rows)
+            candidates.update(self._pending_bands.get((band, bucket), []))
+        if not candidates:
+            return None
+
+        pending = [(doc_id, self._pending_signatures[doc_id][4]) for doc_id in candidates
+                   if doc_id in self._pending_signatures]
+        stored = [doc_id for doc_id in candidates if doc_id not in self._pending_signatures]
+        placeholders = ",".join("?" * len(stored))
+        rows = self._conn.execute(
+            f"SELECT doc_id, signature FROM signatures WHERE doc_id IN ({placeholders})",
+            stored
+        ).fetchall() + pending
+        if not rows:
+            return None
+
+        # Estimated Jaccard similarity against every candidate at once
+        candidate_ids = [row[0] for row in rows]
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.uint64).reshape(len(rows), -1)
+        similarities = (matrix == signature).mean(axis=1)
+        best = int(similarities.argmax())
+        if similarities[best] >= self.threshold:
+            return candidate_ids[best]
+        return None
+
+    def classify(self, items: List[Tuple[str, str, Optional[str], Dict[str, Any]]]) -> List[Optional[str]]:
+        """Register (doc_id, text, channel_id, thread_state) items and return, per item, the
+        canonical doc_id it duplicates, or None when it should be indexed.
+
+        thread_state holds the message's ts, reply_count and latest_reply; it is
+        recorded so collapsed messages can be skipped by later ingests too.
+
+        Items earlier in the batch are visible to later ones. Nothing is written
+        until commit(), so a failed index write can be rolled back.
+        """
+        results = []
+        with self._lock:
+            for doc_id, text, channel_id, thread_state in items:
+                state = (
+                    thread_state.get("ts"),
+                    int(thread_state.get("reply_count", 0)),
+                    thread_state.get("latest_reply", "")
+                )
+                if doc_id in self._pending_signatures:
+                    existing = (self._pending_signatures[doc_id][1],)
+                else:
+                    existing = self._conn.execute(
+                        "SELECT canonical_id FROM signatures WHERE doc_id = ?", (doc_id,)
+                    ).fetchone()
+                if existing:
+                    # Re-ingest of a known message keeps its earlier classification
+                    if doc_id in self._pending_signatures:
+                        self._pending_signatures[doc_id] = self._pending_signatures[doc_id][:5] + state
+                    else:
+                        self._pending_states[doc_id] = state
+                    results.append(existing[0] if existing[0] != doc_id else None)
+                    continue
+
+                signature = self.hasher.signature(text)
+                buckets = self._buckets(signature)
+                canonical_id = self._find_canonical(signature, buckets)
+
+                self._pending_signatures[doc_id] = (
+                    doc_id, canonical_id or doc_id, channel_id, len(text), signature.tobytes()
+                ) + state
+                if canonical_id is None:
+                    # Only canonical documents are candidates for later matches
+                    for band_bucket in buckets:
+                        self._pending_bands.setdefault(band_bucket, []).append(doc_id)
+                results.append(canonical_id)
+        return results
+
+    def commit(self):
+        """Write the rows classified since the last commit in one short transaction"""
+        with self._lock:
+            if not self._pending_signatures and not self._pending_states:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE signatures SET ts = ?, reply_count = ?, latest_reply = ? WHERE doc_id = ?",
+                    [state + (doc_id,) for doc_id, state in self._pending_states.items()]
+                )
+                # Another process may have registered the same message meanwhile
+                inserted = []
+                for row in self._pending_signatures.values():
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO signatures "
+                        "(doc_id, canonical_id, channel_id, length, signature, ts, reply_count, latest_reply) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        row
+                    )
+                    if cursor.rowcount:
+                        inserted.append(row[0])
+                inserted = set(inserted)
+                self._conn.executemany(
+                    "INSERT INTO bands (band, bucket, doc_id) VALUES (?, ?, ?)",
+                    [(band, bucket, doc_id) for (band, bucket), doc_ids in self._pending_bands.items()
+                     for doc_id in doc_ids if doc_id in inserted]
+                )
+            self._pending_signatures = {}
+            self._pending_bands = {}
+            self._pending_states = {}
+
+    def rollback(self):
+        with self._lock:
+            self._pending_signatures = {}
+            self._pending_bands = {}
+            self._pending_states = {}
+
+    def export_to(self, path: str):
+        """Copy the committed index to another database file, e.g. for a snapshot"""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+
+    def import_from(self, path: str):
+        """Merge the signatures of another index file, keeping entries already known here"""
+        with self._lock:
+            self._conn.execute("ATTACH DATABASE ? AS other", (path,))
+            try:
+                # Older files may lack columns added since; copy the ones both have
+                ours = {row[1] for row in self._conn.execute("PRAGMA main.table_info(signatures)")}
+                columns = ", ".join(
+                    row[1] for row in self._conn.execute("PRAGMA other.table_info(signatures)") if row[1] in ours
+                )
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT INTO bands (band, bucket, doc_id) SELECT band, bucket, doc_id FROM other.bands "
+                        "WHERE doc_id NOT IN (SELECT doc_id FROM main.signatures)"
+                    )
+                    self._conn.execute(
+                        f"INSERT OR IGNORE INTO main.signatures ({columns}) SELECT {columns} FROM other.signatures"
+                    )
+            finally:
+                self._conn.execute("DETACH DATABASE other")
+
+    def thread_states(self, channel_id: str) -> Dict[str, Dict[str, Any]]:
+        """Thread state of the collapsed messages of a channel, keyed by ts"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ts, reply_count, latest_reply FROM signatures "
+                "WHERE channel_id = ? AND doc_id != canonical_id AND ts IS NOT NULL",
+                (channel_id,)
+            ).fetchall()
+        return {row[0]: {"reply_count": row[1] or 0, "latest_reply": row[2] or ""} for row in rows}
+
+    def get_duplicates(self, canonical_id: str) -> List[Dict[str, Any]]:
+        """Messages linked to a canonical document"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT doc_id, channel_id FROM signatures WHERE canonical_id = ? AND doc_id != canonical_id",
+                (canonical_id,)
+            ).fetchall()
+        return [{"doc_id": row[0], "channel_id": row[1]} for row in rows]
+
+    def linked_channels(self, channel_ids: List[str]) -> List[str]:
+        """Channels of the canonical documents that messages from the given channels were collapsed into"""
+        if not channel_ids:
+            return []
+        placeholders = ", ".join("?" * len(channel_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT canonical.channel_id FROM signatures duplicate "
+                "JOIN signatures canonical ON canonical.doc_id = duplicate.canonical_id "
+                f"WHERE duplicate.channel_id IN ({placeholders}) AND duplicate.doc_id != duplicate.canonical_id",
+                list(channel_ids)
+            ).fetchall()
+        return [row[0] or "" for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        """How much duplicate volume has been kept out of the vector index"""
+        with self._lock:
+            total, duplicates, total_chars, duplicate_chars = self._conn.execute("""
+                SELECT COUNT(*),
+                       COALESCE(SUM(doc_id != canonical_id), 0),
+                       COALESCE(SUM(length), 0),
+                       COALESCE(SUM(CASE WHEN doc_id != canonical_id THEN length ELSE 0 END), 0)
+                FROM signatures
+            """).fetchone()
+        return {
+            "messages_seen": total,
+            "duplicates_collapsed": duplicates,
+            "duplicate_ratio": duplicates / total if total else 0.0,
+            "duplicate_characters_skipped": duplicate_chars,
+            "total_characters_seen": total_chars
+        }
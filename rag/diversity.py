@@ -0,0 +1,66 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def mmr_select(relevance: np.ndarray, embeddings: np.ndarray, k: int, diversity: float) -> List[int]:
+    """Maximal marginal relevance: pick k candidate indices trading relevance against redundancy.
+
+    diversity is the MMR lambda on the redundancy term: 0 keeps the relevance
+    order, 1 picks the candidates least similar to those already selected.
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+
+    # All pairwise cosine similarities in one matrix product
+    normed = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity = normed @ normed.T
+
+    selected = [int(np.argmax(relevance))]
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    max_similarity = similarity[selected[0]].copy()
+
+    weighted_relevance = (1 - diversity) * relevance
+    for _ in range(min(k, n) - 1):
+        scores = np.where(available, weighted_relevance - diversity * max_similarity, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+
+    return selected
+
+
+def _is_per_result(value: Any, n: int) -> bool:
+    """True for chromadb result fields holding one entry per returned document"""
+    return (
+        isinstance(value, list) and len(value) > 0
+        and isinstance(value[0], (list, np.ndarray)) and len(value[0]) == n
+    )
+
+
+def apply_mmr(results: Dict[str, Any], k: int, diversity: float) -> Dict[str, Any]:
+    """Reorder and truncate chromadb-style results with MMR.
+
+    Relevance is taken from the (possibly reranked) distances, so MMR works
+    on top of whatever ordering the store produced. Results without
+    embeddings are just truncated.
+    """
+    distances = results.get("distances", [[]])[0]
+    n = len(distances)
+    embeddings = results.get("embeddings")
+    if _is_per_result(embeddings, n) and n > 0:
+        relevance = 1 - np.asarray(distances, dtype=np.float32)
+        order = mmr_select(relevance, np.asarray(embeddings[0], dtype=np.float32), k, diversity)
+    else:
+        order = list(range(min(k, n)))
+
+    diversified = {}
+    for key, value in results.items():
+        if _is_per_result(value, n):
+            diversified[key] = [[value[0][i] for i in order]]
+        else:
+            diversified[key] = value
+    return diversified
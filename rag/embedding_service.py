@@ -0,0 +1,229 @@
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Listener, Client
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    EMBEDDING_SERVICE_SOCKET,
+    EMBEDDING_SERVICE_AUTHKEY,
+    EMBEDDING_SERVICE_MAX_BATCH,
+    EMBEDDING_SERVICE_BATCH_WAIT,
+    EMBEDDING_SERVICE_REQUEST_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Operations whose requests from different clients are merged into one model call
+_BATCHED_OPS = {"encode", "predict"}
+
+
+class EmbeddingServiceError(Exception):
+    """Raised on the client when the embedding service reports a failure"""
+
+
+class _PendingRequest:
+    def __init__(self, op: str, name: str, items: List[Any], kwargs: Dict[str, Any]):
+        self.op = op
+        self.name = name
+        self.items = items
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    @property
+    def group(self) -> Tuple[str, str, Tuple]:
+        return (self.op, self.name, tuple(sorted(self.kwargs.items())))
+
+
+class EmbeddingService:
+    """Owns the embedding and cross-encoder models and serves them over a Unix socket.
+
+    Each client connection gets a thread. encode/predict requests from all
+    connections go through one batcher that merges requests for the same model
+    arriving within EMBEDDING_SERVICE_BATCH_WAIT seconds into a single call.
+    """
+
+    def __init__(self, socket_path: str = EMBEDDING_SERVICE_SOCKET, max_batch: int = EMBEDDING_SERVICE_MAX_BATCH,
+                 batch_wait: float = EMBEDDING_SERVICE_BATCH_WAIT):
+        # Imported here so client processes never load the model libraries
+        from rag.model_registry import ModelRegistry
+        self.registry = ModelRegistry()
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self._requests: "queue.Queue[_PendingRequest]" = queue.Queue()
+
+    def serve_forever(self, preload: Optional[List[Tuple[str, str]]] = None):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        listener = Listener(self.socket_path, family="AF_UNIX", authkey=EMBEDDING_SERVICE_AUTHKEY.encode())
+        os.chmod(self.socket_path, 0o600)
+
+        threading.Thread(target=self._batch_loop, name="embedding-batcher", daemon=True).start()
+        if preload:
+            self.registry.preload_in_background(preload)
+
+        logger.info(f"Embedding service listening on {self.socket_path}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed handshakes (e.g. wrong authkey) must not stop the service
+                    logger.warning(f"Rejected embedding service connection: {str(e)}")
+                    continue
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _handle_connection(self, conn):
+        try:
+            while True:
+                try:
+                    op, name, payload, kwargs = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    conn.send(("ok", self._dispatch(op, name, payload, kwargs)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+        finally:
+            conn.close()
+
+    def _dispatch(self, op: str, name: str, payload: Any, kwargs: Dict[str, Any]):
+        if op in _BATCHED_OPS:
+            request = _PendingRequest(op, name, list(payload), kwargs)
+            self._requests.put(request)
+            if not request.done.wait(EMBEDDING_SERVICE_REQUEST_TIMEOUT):
+                raise TimeoutError(f"{op} on {name} not served within {EMBEDDING_SERVICE_REQUEST_TIMEOUT}s")
+            if request.error:
+                raise RuntimeError(request.error)
+            return request.result
+        if op == "load":
+            self.registry.get(payload, name)
+            return self.registry.status()
+        if op == "dimension":
+            return self.registry.get_embedding_dimension(name)
+        if op == "status":
+            return self.registry.status()
+        raise ValueError(f"Unknown embedding service operation: {op}")
+
+    def _collect_batch(self) -> List[_PendingRequest]:
+        """Take one request and any others that arrive within the batch window"""
+        batch = [self._requests.get()]
+        size = len(batch[0].items)
+        deadline = time.time() + self.batch_wait
+        while size < self.max_batch:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.items)
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # Never let the batcher thread die; every client would wait on it
+                logger.error(f"Error running embedding batch: {str(e)}")
+                for request in batch:
+                    if not request.done.is_set():
+                        request.error = str(e)
+                        request.done.set()
+
+    def _run_batch(self, batch: List[_PendingRequest]):
+        """Run each model's requests in the batch as one call and hand back the results"""
+        from rag.model_registry import EMBEDDING, CROSS_ENCODER
+        groups: Dict[Tuple, List[_PendingRequest]] = {}
+        for request in batch:
+            groups.setdefault(request.group, []).append(request)
+
+        for (op, name, _), requests in groups.items():
+            try:
+                items = [item for request in requests for item in request.items]
+                if op == "encode":
+                    output = self.registry.get(EMBEDDING, name).encode(items, **requests[0].kwargs)
+                else:
+                    output = self.registry.get(CROSS_ENCODER, name).predict(items, **requests[0].kwargs)
+                output = np.asarray(output)
+
+                # Split the merged output back per request
+                offset = 0
+                for request in requests:
+                    request.result = output[offset:offset + len(request.items)]
+                    offset += len(request.items)
+            except Exception as e:
+                logger.error(f"Error running {op} on {name}: {str(e)}")
+                for request in requests:
+                    request.error = str(e)
+            finally:
+                for request in requests:
+                    request.done.set()
+
+
+class EmbeddingServiceClient:
+    """Connects to an EmbeddingService. Each thread uses its own connection."""
+
+    def __init__(self, socket_path: str = EMBEDDING_SERVICE_SOCKET):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = Client(self.socket_path, family="AF_UNIX", authkey=EMBEDDING_SERVICE_AUTHKEY.encode())
+            self._local.conn = conn
+        return conn
+
+    def call(self, op: str, name: str, payload: Any = None, **kwargs):
+        conn = self._connection()
+        try:
+            conn.send((op, name, payload, kwargs))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # The service restarted; reconnect on the next call
+            self._local.conn = None
+            raise
+        if status != "ok":
+            raise EmbeddingServiceError(result)
+        return result
+
+
+class RemoteEmbeddingModel:
+    """SentenceTransformer stand-in that encodes through the embedding service"""
+
+    def __init__(self, client: EmbeddingServiceClient, name: str):
+        self.client = client
+        self.name = name
+
+    def encode(self, sentences, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        result = self.client.call("encode", self.name, [sentences] if single else sentences, **kwargs)
+        return result[0] if single else result
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.client.call("dimension", self.name)
+
+
+class RemoteCrossEncoder:
+    """CrossEncoder stand-in that scores pairs through the embedding service"""
+
+    def __init__(self, client: EmbeddingServiceClient, name: str):
+        self.client = client
+        self.name = name
+
+    def predict(self, sentence_pairs, **kwargs) -> np.ndarray:
+        return self.client.call("predict", self.name, sentence_pairs, **kwargs)
@@ -0,0 +1,19 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path: str, mode: str = "w"):
+    """Open a temp file beside path and rename it over path once the block completes.
+
+    Readers, and a restart after a crash, see the old file or the new one, never a partial write.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
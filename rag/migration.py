@@ -0,0 +1,177 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import CHROMA_PERSIST_DIRECTORY, MIGRATION_BATCH_SIZE, PCA_FIT_SAMPLE
+from rag.model_registry import model_registry
+from rag.reduction import has_reducer, fit_projection, embed
+
+logger = logging.getLogger(__name__)
+
+# Held by the one process that runs migrations and snapshot restores on this index
+MAINTENANCE_LOCK_FILE = os.path.join(CHROMA_PERSIST_DIRECTORY, "maintenance.lock")
+
+# Documents indexed this many seconds before a migration started are re-copied too,
+# covering clock differences between processes writing the same index
+CATCH_UP_MARGIN = 60
+
+_maintenance_lock = None
+
+
+def acquire_maintenance_lock() -> bool:
+    """Try to become the process that maintains the index. Held until the process exits."""
+    global _maintenance_lock
+    if _maintenance_lock is not None:
+        return True
+    os.makedirs(CHROMA_PERSIST_DIRECTORY, exist_ok=True)
+    lock_file = open(MAINTENANCE_LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _maintenance_lock = lock_file
+    return True
+
+
+class EmbeddingMigration:
+    """Re-embeds the serving collection into the target model's collection, then switches over.
+
+    The old collection keeps serving searches and taking writes while batches are
+    copied. Writes are blocked only for the final catch-up of documents added
+    or updated during the copy, right before the switch. The store's configured dimension
+    reduction is applied too; a PCA projection is fitted first if there is none.
+    """
+
+    def __init__(self, vector_store, target_model_name: Optional[str] = None, batch_size: int = MIGRATION_BATCH_SIZE):
+        self.vector_store = vector_store
+        self.target_model_name = target_model_name or vector_store.target_model_name
+        self.target_reduction = vector_store.target_reduction
+        self.batch_size = batch_size
+        self.state = "pending"
+        self.total = 0
+        self.migrated = 0
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def _copy(self, source, target, ids=None, offset: int = 0) -> int:
+        """Re-embed one batch from source into target. Returns the number of documents copied."""
+        if ids is not None:
+            batch = source.get(ids=ids, include=["documents", "metadatas"])
+        else:
+            batch = source.get(limit=self.batch_size, offset=offset, include=["documents", "metadatas"])
+
+        if not batch["ids"]:
+            return 0
+
+        embeddings = embed(self.target_model_name, self.target_reduction, batch["documents"])
+        target.upsert(
+            ids=batch["ids"],
+            documents=batch["documents"],
+            embeddings=embeddings,
+            metadatas=batch["metadatas"]
+        )
+        return len(batch["ids"])
+
+    def run(self):
+        """Run the migration synchronously"""
+        source_index = self.vector_store._index
+        if (source_index.model_name, source_index.reduction) == (self.target_model_name, self.target_reduction):
+            self.state = "completed"
+            return
+
+        self.state = "running"
+        self.started_at = time.time()
+        try:
+            source = source_index.collection
+            if self.target_reduction and not has_reducer(self.target_model_name, self.target_reduction):
+                self._fit_projection(source_index)
+            target = self.vector_store.get_collection_for(self.target_model_name, self.target_reduction)
+            self.total = source.count()
+
+            logger.info(
+                f"Migrating {self.total} documents from {source.name} to {target.name} "
+                f"in batches of {self.batch_size}"
+            )
+
+            # Bulk copy while the old collection keeps serving
+            while True:
+                copied = self._copy(source, target, offset=self.migrated)
+                if copied == 0:
+                    break
+                self.migrated += copied
+                logger.info(f"Migrated {self.migrated}/{self.total} documents")
+
+            # Catch up on documents added, or upserted in place by thread refreshes,
+            # during the copy, then switch atomically
+            with self.vector_store._write_lock:
+                catch_up_started = time.time()
+                missing = set(source.get(include=[])["ids"]) - set(target.get(include=[])["ids"])
+                updated = source.get(where={"indexed_at": {"$gte": self.started_at - CATCH_UP_MARGIN}}, include=[])
+                stale = list(missing | set(updated["ids"]))
+                for i in range(0, len(stale), self.batch_size):
+                    self._copy(source, target, ids=stale[i:i + self.batch_size])
+                self.total = source.count()
+                self.vector_store.switch_index(self.target_model_name, target, self.target_reduction)
+
+            # Other processes switch on their next access to the index; carry over
+            # what they wrote to the old collection in the meantime
+            self._copy_newer(source, target, since=catch_up_started - CATCH_UP_MARGIN)
+            self.migrated = target.count()
+
+            self.state = "completed"
+            logger.info(f"Migration complete, now serving from {target.name}")
+
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            logger.error(f"Error migrating embeddings: {str(e)}")
+        finally:
+            self.finished_at = time.time()
+
+    def _copy_newer(self, source, target, since: float):
+        """Re-copy documents indexed in source since the given time whose target copy is older"""
+        recent = source.get(where={"indexed_at": {"$gte": since}}, include=["metadatas"])
+        if not recent["ids"]:
+            return
+        current = target.get(ids=recent["ids"], include=["metadatas"])
+        target_indexed_at = {i: m.get("indexed_at", 0) for i, m in zip(current["ids"], current["metadatas"])}
+        newer = [
+            doc_id for doc_id, metadata in zip(recent["ids"], recent["metadatas"])
+            if metadata["indexed_at"] > target_indexed_at.get(doc_id, -1)
+        ]
+        for i in range(0, len(newer), self.batch_size):
+            self._copy(source, target, ids=newer[i:i + self.batch_size])
+
+    def _fit_projection(self, source_index):
+        """Fit the PCA projection on full-dimension embeddings of up to PCA_FIT_SAMPLE documents"""
+        if source_index.model_name == self.target_model_name and not source_index.reduction:
+            # The serving collection already holds the target model's full embeddings
+            embeddings = source_index.collection.get(limit=PCA_FIT_SAMPLE, include=["embeddings"])["embeddings"]
+        else:
+            sample = source_index.collection.get(limit=PCA_FIT_SAMPLE, include=["documents"])
+            embeddings = model_registry.get_embedding_model(self.target_model_name).encode(sample["documents"])
+        fit_projection(self.target_model_name, self.target_reduction, embeddings)
+
+    def start_in_background(self) -> threading.Thread:
+        """Run the migration on a daemon thread and return immediately"""
+        self._thread = threading.Thread(target=self.run, name="embedding-migration", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "target_model": self.target_model_name,
+            "target_reduction": self.target_reduction,
+            "total": self.total,
+            "migrated": self.migrated,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
@@ -0,0 +1,178 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import EMBEDDING_SERVICE_SOCKET
+
+logger = logging.getLogger(__name__)
+
+# Model kinds understood by the registry
+EMBEDDING = "embedding"
+CROSS_ENCODER = "cross_encoder"
+
+
+def _load_sentence_transformer(name: str):
+    # Imported lazily so processes using the embedding service never load torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name)
+
+
+def _load_cross_encoder(name: str):
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(name)
+
+
+_LOADERS = {
+    EMBEDDING: _load_sentence_transformer,
+    CROSS_ENCODER: _load_cross_encoder,
+}
+
+# Output dimensions of the models listed in config, so collection names can be
+# resolved without loading the weights
+KNOWN_EMBEDDING_DIMENSIONS = {
+    "all-MiniLM-L6-v2": 384,
+    "all-mpnet-base-v2": 768,
+    "multi-qa-mpnet-base-dot-v1": 768,
+    "e5-large-v2": 1024,
+    "intfloat/e5-large-v2": 1024,
+}
+
+
+class ModelRegistry:
+    """Process-wide cache that loads each model once and shares it between stores.
+
+    With a service socket configured, models live in the shared embedding
+    service process instead and the registry hands out lightweight proxies.
+    """
+
+    def __init__(self, service_socket: Optional[str] = None):
+        self.service_socket = service_socket
+        self._client = None
+        if service_socket:
+            from rag.embedding_service import EmbeddingServiceClient
+            self._client = EmbeddingServiceClient(service_socket)
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._load_times: Dict[Tuple[str, str], float] = {}
+        self._errors: Dict[Tuple[str, str], str] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._expected: List[Tuple[str, str]] = []
+        self._warm_up_thread = None
+
+    def _key_lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._lock:
+            if key not in self._locks:
+                self._locks[key] = threading.Lock()
+            return self._locks[key]
+
+    def get(self, kind: str, name: str):
+        """Return the model, loading it on first use. Concurrent callers wait for a single load."""
+        key = (kind, name)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._key_lock(key):
+            # Another thread may have finished loading while we waited
+            if key in self._models:
+                return self._models[key]
+
+            logger.info(f"Loading {kind} model: {name}")
+            start_time = time.time()
+            try:
+                model = self._load_remote(kind, name) if self._client else _LOADERS[kind](name)
+            except Exception as e:
+                self._errors[key] = str(e)
+                logger.error(f"Error loading {kind} model {name}: {str(e)}")
+                raise
+
+            self._load_times[key] = time.time() - start_time
+            self._errors.pop(key, None)
+            self._models[key] = model
+            logger.info(f"Loaded {kind} model {name} in {self._load_times[key]:.2f}s")
+            return model
+
+    def _load_remote(self, kind: str, name: str):
+        """Have the embedding service load the model and return a proxy for it"""
+        from rag.embedding_service import RemoteEmbeddingModel, RemoteCrossEncoder
+        self._client.call("load", name, kind)
+        if kind == EMBEDDING:
+            return RemoteEmbeddingModel(self._client, name)
+        return RemoteCrossEncoder(self._client, name)
+
+    def get_embedding_model(self, name: str):
+        return self.get(EMBEDDING, name)
+
+    def get_cross_encoder(self, name: str):
+        return self.get(CROSS_ENCODER, name)
+
+    def get_embedding_dimension(self, name: str) -> int:
+        """Output dimension of an embedding model, loading it only if the dimension is not known"""
+        if name in KNOWN_EMBEDDING_DIMENSIONS:
+            return KNOWN_EMBEDDING_DIMENSIONS[name]
+        return self.get_embedding_model(name).get_sentence_embedding_dimension()
+
+    def is_loaded(self, kind: str, name: str) -> bool:
+        return (kind, name) in self._models
+
+    def preload(self, specs: List[Tuple[str, str]]):
+        """Load the given (kind, name) models synchronously"""
+        for kind, name in specs:
+            if (kind, name) not in self._expected:
+                self._expected.append((kind, name))
+        for kind, name in specs:
+            try:
+                self.get(kind, name)
+            except Exception:
+                # Already logged and recorded in status; keep loading the rest
+                pass
+
+    def preload_in_background(self, specs: List[Tuple[str, str]]) -> threading.Thread:
+        """Start loading the given models on a daemon thread and return immediately"""
+        for kind, name in specs:
+            if (kind, name) not in self._expected:
+                self._expected.append((kind, name))
+        self._warm_up_thread = threading.Thread(
+            target=self.preload,
+            args=(specs,),
+            name="model-warm-up",
+            daemon=True
+        )
+        self._warm_up_thread.start()
+        return self._warm_up_thread
+
+    def is_ready(self) -> bool:
+        """True once every model requested through preload has been loaded"""
+        return all(key in self._models for key in self._expected)
+
+    def status(self) -> Dict[str, Any]:
+        """Readiness and per-model load information for the status endpoint"""
+        models = []
+        for kind, name in self._expected or list(self._models.keys()):
+            key = (kind, name)
+            if key in self._models:
+                state = "loaded"
+            elif key in self._errors:
+                state = "error"
+            else:
+                state = "loading"
+            entry = {
+                "kind": kind,
+                "name": name,
+                "state": state,
+                "load_time": self._load_times.get(key)
+            }
+            if key in self._errors:
+                entry["error"] = self._errors[key]
+            models.append(entry)
+
+        return {
+            "ready": self.is_ready(),
+            "embedding_service": self.service_socket,
+            "models": models
+        }
+
+
+# Shared by every vector store in the process
+model_registry = ModelRegistry(EMBEDDING_SERVICE_SOCKET)
@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import CHROMA_PERSIST_DIRECTORY
+from rag.files import atomic_write
+from rag.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+PCA = "pca"
+MATRYOSHKA = "matryoshka"
+
+# Models trained with Matryoshka representation learning, whose leading
+# dimensions form a usable embedding on their own
+MATRYOSHKA_MODELS = {
+    "nomic-ai/nomic-embed-text-v1.5",
+    "mixedbread-ai/mxbai-embed-large-v1",
+    "Alibaba-NLP/gte-base-en-v1.5",
+    "Alibaba-NLP/gte-large-en-v1.5",
+    "Snowflake/snowflake-arctic-embed-m-v1.5",
+    "tomaarsen/mpnet-base-nli-matryoshka",
+}
+
+_SPEC_PATTERN = re.compile(rf"^({PCA}|{MATRYOSHKA})(\d+)$")
+
+# Loaded reducers by (model name, spec); projections are read from disk once
+_reducers: Dict[Tuple[str, str], Any] = {}
+
+
+def reduction_spec(method: Optional[str], dimension: int) -> Optional[str]:
+    """Identifier of a reduction such as "pca256", or None when no reduction is configured"""
+    if not method or method == "none":
+        return None
+    if method not in (PCA, MATRYOSHKA):
+        raise ValueError(f"Unknown embedding reduction: {method}. Use {PCA} or {MATRYOSHKA}")
+    return f"{method}{dimension}"
+
+
+def parse_spec(spec: str) -> Tuple[str, int]:
+    match = _SPEC_PATTERN.match(spec)
+    if not match:
+        raise ValueError(f"Invalid embedding reduction: {spec}")
+    return match.group(1), int(match.group(2))
+
+
+def projection_path(model_name: str, dimension: int) -> str:
+    """Where the PCA projection fitted for a model and target dimension is persisted"""
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", model_name).strip("-._")
+    return os.path.join(CHROMA_PERSIST_DIRECTORY, f"projection__{slug}__{PCA}{dimension}.npz")
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class TruncationReducer:
+    """Keeps the leading dimensions of a Matryoshka embedding and re-normalizes"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.shape[1] < self.dimension:
+            raise ValueError(f"Cannot truncate {embeddings.shape[1]}-dim embeddings to {self.dimension}")
+        return _normalize(embeddings[:, :self.dimension])
+
+
+class PCAReducer:
+    """Projects embeddings onto the top principal components of the corpus and re-normalizes"""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray):
+        self.mean = mean.astype(np.float32)
+        self.components = components.astype(np.float32)
+
+    @property
+    def dimension(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, dimension: int) -> "PCAReducer":
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        if len(embeddings) < dimension:
+            raise ValueError(f"Fitting {dimension} PCA components needs at least {dimension} documents, got {len(embeddings)}")
+        mean = embeddings.mean(axis=0)
+        # Rows of vt are the principal directions, largest variance first
+        _, _, vt = np.linalg.svd(embeddings - mean, full_matrices=False)
+        return cls(mean, vt[:dimension])
+
+    def truncated(self, dimension: int) -> "PCAReducer":
+        """The same projection keeping fewer components"""
+        return PCAReducer(self.mean, self.components[:dimension])
+
+    def transform(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        return _normalize((embeddings - self.mean) @ self.components.T)
+
+    def save(self, path: str):
+        with atomic_write(path, "wb") as f:
+            np.savez(f, mean=self.mean, components=self.components)
+
+    @classmethod
+    def load(cls, path: str) -> "PCAReducer":
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"])
+
+
+def has_reducer(model_name: str, spec: str) -> bool:
+    """False only for a PCA projection that has not been fitted yet"""
+    method, dimension = parse_spec(spec)
+    return method != PCA or os.path.exists(projection_path(model_name, dimension))
+
+
+def get_reducer(model_name: str, spec: str):
+    """Reducer for a model and spec. PCA projections must have been fitted with fit_projection."""
+    key = (model_name, spec)
+    if key not in _reducers:
+        method, dimension = parse_spec(spec)
+        if method == MATRYOSHKA:
+            if model_name not in MATRYOSHKA_MODELS:
+                logger.warning(f"{model_name} is not a known Matryoshka model; truncated embeddings may lose recall")
+            _reducers[key] = TruncationReducer(dimension)
+        else:
+            path = projection_path(model_name, dimension)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No PCA projection fitted for {model_name} at {path}")
+            _reducers[key] = PCAReducer.load(path)
+    return _reducers[key]
+
+
+def set_projection(model_name: str, spec: str, reducer: PCAReducer):
+    """Persist a PCA projection and use it from now on"""
+    _, dimension = parse_spec(spec)
+    reducer.save(projection_path(model_name, dimension))
+    _reducers[(model_name, spec)] = reducer
+
+
+def fit_projection(model_name: str, spec: str, embeddings: np.ndarray) -> PCAReducer:
+    """Fit a PCA projection on full-dimension corpus embeddings and persist it"""
+    _, dimension = parse_spec(spec)
+    reducer = PCAReducer.fit(embeddings, dimension)
+    set_projection(model_name, spec, reducer)
+    logger.info(f"Fitted {dimension}-component PCA projection for {model_name} on {len(embeddings)} documents")
+    return reducer
+
+
+def embed(model_name: str, spec: Optional[str], texts: List[str]) -> List[List[float]]:
+    """Encode texts and apply the reduction. Documents and queries both go through here."""
+    embeddings = model_registry.get_embedding_model(model_name).encode(texts)
+    if spec:
+        embeddings = get_reducer(model_name, spec).transform(embeddings)
+    return embeddings.tolist()
+
+
+def evaluate_dimensions(corpus: np.ndarray, queries: np.ndarray, method: str, dimensions: List[int],
+                        k: int = 10, query_rows: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """Recall@k, vector memory and exact-search latency of each reduced dimension.
+
+    Recall is measured against exact cosine top-k at full dimension. When the
+    queries are documents of the corpus, query_rows gives their corpus row so
+    they are not counted as their own neighbour. PCA is fitted on the corpus.
+    """
+    corpus = _normalize(np.asarray(corpus, dtype=np.float32))
+    queries = _normalize(np.asarray(queries, dtype=np.float32))
+    depth = k + 1 if query_rows is not None else k
+
+    def top_k(docs: np.ndarray, qs: np.ndarray) -> Tuple[List[set], float]:
+        start = time.perf_counter()
+        scores = qs @ docs.T
+        ranked = np.argpartition(-scores, min(depth, len(docs)) - 1, axis=1)[:, :depth]
+        elapsed = time.perf_counter() - start
+        neighbours = []
+        for i, row in enumerate(ranked):
+            row = row[np.argsort(-scores[i, row])]
+            if query_rows is not None:
+                row = row[row != query_rows[i]]
+            neighbours.append(set(row[:k].tolist()))
+        return neighbours, elapsed
+
+    truth, full_time = top_k(corpus, queries)
+    rows = [{
+        "dimension": corpus.shape[1],
+        "recall_at_k": 1.0,
+        "vectors_mb": corpus.nbytes / 2 ** 20,
+        "query_ms": full_time * 1000 / len(queries)
+    }]
+
+    pca = PCAReducer.fit(corpus, max(dimensions)) if method == PCA else None
+    for dimension in sorted(dimensions, reverse=True):
+        reducer = pca.truncated(dimension) if pca else TruncationReducer(dimension)
+        reduced, reduced_queries = reducer.transform(corpus), reducer.transform(queries)
+        found, elapsed = top_k(reduced, reduced_queries)
+        recall = np.mean([len(f & t) / max(1, len(t)) for f, t in zip(found, truth)])
+        rows.append({
+            "dimension": dimension,
+            "recall_at_k": float(recall),
+            "vectors_mb": reduced.nbytes / 2 ** 20,
+            "query_ms": elapsed * 1000 / len(queries)
+        })
+    return rows
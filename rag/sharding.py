@@ -0,0 +1,208 @@
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from config import SHARD_QUERY_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Per-result fields of a chromadb query/get response
+_RESULT_FIELDS = ["ids", "documents", "metadatas", "distances", "embeddings"]
+
+# Shard for documents indexed without a channel
+UNASSIGNED_SHARD = "unassigned"
+
+# Minimum seconds between re-reads of the collection list, which picks up
+# shards created by other processes sharing the directory
+SHARD_RELOAD_INTERVAL = 5.0
+
+_executor = ThreadPoolExecutor(max_workers=SHARD_QUERY_WORKERS, thread_name_prefix="shard-query")
+
+
+def shard_name(base_name: str, channel_id: str) -> str:
+    """Collection name of one channel's shard, within Chroma's 63 character limit"""
+    suffix = channel_id or UNASSIGNED_SHARD
+    name = f"{base_name}__{suffix}"
+    if len(name) > 63:
+        digest = hashlib.md5(base_name.encode()).hexdigest()[:8]
+        name = f"{base_name[:63 - len(suffix) - 11]}-{digest}__{suffix}"
+    return name
+
+
+def channel_flag(channel_id: str) -> str:
+    """Metadata key set on a document that a message from another channel was collapsed into"""
+    return f"in_channel__{channel_id}"
+
+
+def channels_in_where(where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """Channels a where clause restricts to, or None if it does not filter by channel"""
+    if not where:
+        return None
+    clauses = where.get("$and", [where])
+    for clause in clauses:
+        # build_where matches a channel directly or through the channel's flag
+        for alternative in clause.get("$or", [clause]):
+            condition = alternative.get("channel_id")
+            if condition is None:
+                continue
+            if isinstance(condition, str):
+                return [condition]
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    return [condition["$eq"]]
+                if "$in" in condition:
+                    return list(condition["$in"])
+    return None
+
+
+class ShardedCollection:
+    """One Chroma collection per channel behind the subset of the Collection API the stores use.
+
+    Writes are routed by the channel_id metadata. Queries fan out in parallel
+    to only the shards selected by the channel filter and the results are
+    merged by distance. linked_channels maps filtered channels to the other
+    channels whose documents duplicates from them were collapsed into.
+    """
+
+    def __init__(self, client, base_name: str, metadata: Dict[str, Any],
+                 linked_channels: Optional[Callable[[List[str]], List[str]]] = None):
+        self.client = client
+        self.name = base_name
+        self.metadata = metadata
+        self.linked_channels = linked_channels
+        self._shards: Dict[str, Any] = {}
+        self._loaded_at = 0.0
+        self._load_shards()
+
+    def _load_shards(self):
+        shards = dict(self._shards)
+        known = {shard.name for shard in shards.values()}
+        # Shard names may be truncated, so shards are recognised by their metadata
+        for collection in self.client.list_collections():
+            name = collection if isinstance(collection, str) else collection.name
+            if name in known or not name.startswith(self.name[:20]):
+                continue
+            shard = self.client.get_collection(name)
+            if (shard.metadata or {}).get("shard_of") == self.name:
+                shards[shard.metadata["channel_id"]] = shard
+        # Swapped in whole so concurrent queries never see the dict change size
+        self._shards = shards
+        self._loaded_at = time.monotonic()
+
+    def _shard(self, channel_id: str):
+        key = channel_id or UNASSIGNED_SHARD
+        if key not in self._shards:
+            self._shards[key] = self.client.get_or_create_collection(
+                name=shard_name(self.name, channel_id),
+                metadata=dict(self.metadata, shard_of=self.name, channel_id=key)
+            )
+        return self._shards[key]
+
+    def _select(self, where: Optional[Dict[str, Any]]) -> List[Any]:
+        channels = channels_in_where(where)
+        if channels is not None and self.linked_channels:
+            # A document flagged with a channel stays in the shard of the channel it was posted in
+            channels = list(dict.fromkeys(channels + self.linked_channels(channels)))
+        keys = None if channels is None else [channel_id or UNASSIGNED_SHARD for channel_id in channels]
+        # Another process may have created the shard since the list was read
+        if keys is None or any(key not in self._shards for key in keys):
+            if time.monotonic() - self._loaded_at >= SHARD_RELOAD_INTERVAL:
+                self._load_shards()
+        shards = self._shards
+        if keys is None:
+            return [shards[key] for key in sorted(shards)]
+        return [shards[key] for key in keys if key in shards]
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self._select(None))
+
+    def _group(self, metadatas) -> Dict[str, List[int]]:
+        """Positions of a write's rows by the channel whose shard they belong to"""
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(metadata.get("channel_id", ""), []).append(i)
+        return groups
+
+    def upsert(self, ids, embeddings, metadatas, documents=None):
+        for channel_id, positions in self._group(metadatas).items():
+            self._shard(channel_id).upsert(
+                ids=[ids[i] for i in positions],
+                embeddings=[embeddings[i] for i in positions],
+                metadatas=[metadatas[i] for i in positions],
+                documents=[documents[i] for i in positions] if documents is not None else None
+            )
+
+    add = upsert
+
+    def update(self, ids, metadatas):
+        for channel_id, positions in self._group(metadatas).items():
+            self._shard(channel_id).update(
+                ids=[ids[i] for i in positions],
+                metadatas=[metadatas[i] for i in positions]
+            )
+
+    def query(self, query_embeddings, n_results: int, where: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        shards = self._select(where)
+        if not shards:
+            return {field: [[]] for field in _RESULT_FIELDS}
+
+        def query_shard(shard):
+            count = shard.count()
+            if count == 0:
+                return None
+            return shard.query(
+                query_embeddings=query_embeddings,
+                n_results=min(n_results, count),
+                where=where,
+                **kwargs
+            )
+
+        partials = [r for r in _executor.map(query_shard, shards) if r is not None]
+        return self._merge(partials, n_results)
+
+    def _merge(self, partials: List[Dict[str, Any]], n_results: int) -> Dict[str, Any]:
+        rows = []
+        for partial in partials:
+            fields = {f: partial.get(f)[0] for f in _RESULT_FIELDS if partial.get(f) is not None}
+            for i in range(len(fields.get("ids", []))):
+                rows.append({f: values[i] for f, values in fields.items()})
+        rows.sort(key=lambda row: row.get("distances", 0))
+        rows = rows[:n_results]
+        present = {f for partial in partials for f in _RESULT_FIELDS if partial.get(f) is not None}
+        return {f: [[row[f] for row in rows]] if f in present else None for f in _RESULT_FIELDS}
+
+    def get(self, ids=None, where=None, limit: Optional[int] = None, offset: Optional[int] = None, include=None):
+        """Get across shards. Without filters, limit/offset page over the shards in a stable order."""
+        include = include if include is not None else ["documents", "metadatas"]
+        merged = {"ids": [], **{f: [] for f in include}}
+
+        def extend(result):
+            merged["ids"].extend(result["ids"])
+            for f in include:
+                merged[f].extend(result.get(f) if result.get(f) is not None else [])
+
+        if ids is not None or where is not None:
+            for shard in self._select(where):
+                extend(shard.get(ids=ids, where=where, include=include))
+            start = offset or 0
+            end = start + limit if limit is not None else None
+            return {f: values[start:end] for f, values in merged.items()}
+
+        skip = offset or 0
+        remaining = limit
+        for shard in self._select(None):
+            if remaining is not None and remaining <= 0:
+                break
+            # Skip whole shards that lie before the requested page
+            size = shard.count()
+            if skip >= size:
+                skip -= size
+                continue
+            result = shard.get(limit=remaining, offset=skip, include=include)
+            skip = 0
+            extend(result)
+            if remaining is not None:
+                remaining -= len(result["ids"])
+        return merged
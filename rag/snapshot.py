@@ -0,0 +1,179 @@
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from typing import Any, Dict
+
+import numpy as np
+
+from config import SNAPSHOT_BATCH_SIZE
+from rag.reduction import PCA, PCAReducer, parse_spec, projection_path, set_projection
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout, stored as a single zip archive:
+# - manifest.json: model, reduction, dimension, document count and format version
+# - embeddings.npy: float32 matrix, one row per document, in records.jsonl order
+# - records.jsonl: one {"id", "document", "metadata"} object per line
+# - projection.npz: the PCA projection, when the embeddings are PCA-reduced
+# - dedup.sqlite3: near-duplicate signatures, so reposts stay collapsed after a restore
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def _npy_header(rows: int, dimension: int) -> bytes:
+    """Header of a float32 .npy file with the given shape"""
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {
+        "descr": np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+        "fortran_order": False,
+        "shape": (rows, dimension)
+    })
+    return header.getvalue()
+
+
+def save_snapshot(vector_store, path: str, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Dict[str, Any]:
+    """Write the serving collection, embeddings included, to a snapshot archive.
+
+    Documents are streamed in batches so memory stays flat regardless of index size.
+    """
+    index = vector_store._index
+    collection = index.collection
+    total = collection.count()
+    dimension = collection.metadata.get("dimension") if collection.metadata else None
+    start_time = time.time()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    # Embeddings are staged in a side file because a zip archive can only
+    # have one entry open for writing at a time
+    tmp_embeddings_path = path + ".embeddings.tmp"
+
+    written = 0
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        with open(tmp_embeddings_path, "wb") as emb_file, \
+                zf.open("records.jsonl", "w", force_zip64=True) as rec_file:
+            # Reserve space for the header; the dimension is known after the first batch
+            emb_file.write(_npy_header(total, dimension or 0))
+            offset = 0
+            while offset < total:
+                batch = collection.get(
+                    limit=batch_size,
+                    offset=offset,
+                    include=["documents", "metadatas", "embeddings"]
+                )
+                if not batch["ids"]:
+                    break
+
+                embeddings = np.asarray(batch["embeddings"], dtype=np.float32)
+                dimension = dimension or embeddings.shape[1]
+                emb_file.write(embeddings.tobytes())
+
+                for doc_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                    record = {"id": doc_id, "document": document, "metadata": metadata}
+                    rec_file.write((json.dumps(record) + "\n").encode())
+
+                written += len(batch["ids"])
+                offset += len(batch["ids"])
+
+            # Rewrite the header with the final shape. Headers are padded to a
+            # fixed alignment, so it occupies the same number of bytes.
+            final_header = _npy_header(written, dimension or 0)
+            if len(final_header) != len(_npy_header(total, dimension or 0)):
+                raise RuntimeError("Snapshot header size changed; retry the snapshot")
+            emb_file.seek(0)
+            emb_file.write(final_header)
+
+        zf.write(tmp_embeddings_path, "embeddings.npy")
+        os.remove(tmp_embeddings_path)
+
+        # Queries against the restored index must be projected the same way
+        if index.reduction and parse_spec(index.reduction)[0] == PCA:
+            zf.write(projection_path(index.model_name, parse_spec(index.reduction)[1]), "projection.npz")
+
+        if vector_store.dedup:
+            tmp_dedup_path = path + ".dedup.tmp"
+            vector_store.dedup.export_to(tmp_dedup_path)
+            zf.write(tmp_dedup_path, "dedup.sqlite3")
+            os.remove(tmp_dedup_path)
+
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "embedding_model": index.model_name,
+            "reduction": index.reduction,
+            "dimension": dimension,
+            "collection_name": collection.name,
+            "count": written,
+            "created_at": time.time()
+        }
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+    # Only replace an existing snapshot once the new one is complete
+    os.replace(tmp_path, path)
+    logger.info(f"Saved snapshot of {written} documents to {path} in {time.time() - start_time:.2f}s")
+    return manifest
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    with zipfile.ZipFile(path) as zf:
+        return json.loads(zf.read("manifest.json"))
+
+
+def restore_snapshot(vector_store, path: str, batch_size: int = SNAPSHOT_BATCH_SIZE) -> Dict[str, Any]:
+    """Load a snapshot into the collection for its model and make that collection serve.
+
+    Stored embeddings are inserted as-is, so no documents are re-encoded.
+    """
+    start_time = time.time()
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+
+        model_name = manifest["embedding_model"]
+        reduction = manifest.get("reduction")
+        if reduction and parse_spec(reduction)[0] == PCA:
+            with zf.open("projection.npz") as projection_file:
+                set_projection(model_name, reduction, PCAReducer.load(io.BytesIO(projection_file.read())))
+        collection = vector_store.get_collection_for(model_name, reduction)
+
+        if vector_store.dedup and "dedup.sqlite3" in zf.namelist():
+            tmp_dedup_path = path + ".dedup.tmp"
+            with zf.open("dedup.sqlite3") as src, open(tmp_dedup_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            try:
+                vector_store.dedup.import_from(tmp_dedup_path)
+            finally:
+                os.remove(tmp_dedup_path)
+
+        with zf.open("embeddings.npy") as emb_file, zf.open("records.jsonl") as rec_file:
+            version = np.lib.format.read_magic(emb_file)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(emb_file)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(emb_file)
+            rows, dimension = shape
+            row_bytes = dimension * dtype.itemsize
+            records = io.TextIOWrapper(rec_file, encoding="utf-8")
+
+            restored = 0
+            while restored < rows:
+                count = min(batch_size, rows - restored)
+                embeddings = np.frombuffer(emb_file.read(count * row_bytes), dtype=dtype).reshape(count, dimension)
+                batch = [json.loads(records.readline()) for _ in range(count)]
+
+                collection.upsert(
+                    ids=[r["id"] for r in batch],
+                    documents=[r["document"] for r in batch],
+                    metadatas=[r["metadata"] for r in batch],
+                    embeddings=embeddings.tolist()
+                )
+                restored += count
+
+    with vector_store._write_lock:
+        vector_store.switch_index(model_name, collection, reduction)
+
+    logger.info(f"Restored {restored} documents from {path} in {time.time() - start_time:.2f}s")
+    return manifest
@@ -0,0 +1,21 @@
+from config import VECTOR_STORE, EMBEDDING_MODEL
+from rag.vector_store import VectorStore
+from rag.vector_store_minilm import MiniLmVectorStore
+from rag.vector_store_mpnet import MPNetVectorStore
+from rag.vector_store_e5 import E5VectorStore
+
+# Store variants selectable through the VECTOR_STORE setting
+VECTOR_STORES = {
+    "minilm": MiniLmVectorStore,
+    "mpnet": MPNetVectorStore,
+    "e5": E5VectorStore,
+}
+
+
+def create_vector_store(store_type: str = VECTOR_STORE, model_name: str = EMBEDDING_MODEL) -> VectorStore:
+    """Build the vector store selected in config"""
+    if store_type not in VECTOR_STORES:
+        raise ValueError(
+            f"Unknown vector store '{store_type}'. Available: {', '.join(VECTOR_STORES)}"
+        )
+    return VECTOR_STORES[store_type](model_name)
@@ -1,32 +1,274 @@
 import os
-from typing import List, Dict, Any
+import re
+import logging
+import threading
+import time
+from collections import namedtuple
+from typing import List, Dict, Any, Tuple, Optional
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import json
 import hashlib
 from abc import ABC, abstractmethod
-from config import CHROMA_PERSIST_DIRECTORY, EMBEDDING_MODEL
+from config import (
+    CHROMA_PERSIST_DIRECTORY, CHROMA_HOST, CHROMA_PORT, EMBEDDING_MODEL, DEDUP_ENABLED, MMR_CANDIDATE_MULTIPLIER, SHARD_BY_CHANNEL,
+    EMBEDDING_REDUCTION, EMBEDDING_REDUCED_DIMENSION, PCA_FIT_SAMPLE,
+)
+from rag.model_registry import model_registry, EMBEDDING
+from rag.migration import EmbeddingMigration
+from rag.dedup import NearDuplicateIndex
+from rag.diversity import apply_mmr
+from rag.sharding import ShardedCollection, channel_flag
+from rag.deadline import Deadline
+from rag.files import atomic_write
+from rag.reduction import reduction_spec, parse_spec, has_reducer, embed
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_PREFIX = "slack_bug_reports"
+
+# Records which model's (and reduction's) collection is currently serving, so a
+# change in config keeps the old collection live until the migration has finished
+ACTIVE_INDEX_FILE = os.path.join(CHROMA_PERSIST_DIRECTORY, "active_index.json")
+
+# The model, collection and dimension reduction that serve reads and writes. Swapped
+# as one object so a query never pairs one model's query embedding with another's collection.
+ActiveIndex = namedtuple("ActiveIndex", ["model_name", "collection", "reduction"], defaults=(None,))
+
+# Result fields a search returns; MMR additionally needs the candidates' embeddings
+RESULT_INCLUDE = ["documents", "metadatas", "distances"]
+MMR_INCLUDE = RESULT_INCLUDE + ["embeddings"]
+
+# Near-duplicate signatures are keyed by document id, so one index serves every model's collection
+DEDUP_INDEX_FILE = os.path.join(CHROMA_PERSIST_DIRECTORY, "dedup_index.sqlite3")
+
+
+def collection_name_for(model_name: str, dimension: int, reduction: Optional[str] = None) -> str:
+    """Collection name namespaced by embedding model and dimension (or reduction, e.g. pca256)"""
+    slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", model_name).strip("-._")
+    suffix = reduction or str(dimension)
+    name = f"{COLLECTION_PREFIX}__{slug}__{suffix}"
+    # Chroma limits collection names to 63 characters
+    if len(name) > 63:
+        digest = hashlib.md5(model_name.encode()).hexdigest()[:8]
+        name = f"{COLLECTION_PREFIX}__{slug[:63 - len(COLLECTION_PREFIX) - len(suffix) - 14]}-{digest}__{suffix}"
+    return name
+
+
+def build_where(channels: Optional[List[str]] = None, start_ts: Optional[float] = None,
+                end_ts: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Chroma where clause for channel and date-range filters, evaluated inside the index.
+
+    A channel also matches documents that a near-duplicate posted in it was collapsed into.
+    """
+    clauses = []
+    if channels:
+        clauses.append({"$or": [{"channel_id": {"$in": list(channels)}}] + [
+            {channel_flag(channel_id): True} for channel_id in channels
+        ]})
+    if start_ts is not None:
+        clauses.append({"ts_epoch": {"$gte": start_ts}})
+    if end_ts is not None:
+        clauses.append({"ts_epoch": {"$lte": end_ts}})
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def format_results(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten chromadb-style results into one dict per similar report"""
+    documents = results.get("documents", [[]])[0]
+    metadatas = results.get("metadatas", [[]])[0]
+    distances = results.get("distances", [[]])[0]
+    reports = []
+    for i, doc in enumerate(documents):
+        reports.append({
+            "document": doc,
+            "metadata": metadatas[i] if i < len(metadatas) else {},
+            "score": float(distances[i]) if i < len(distances) else None
+        })
+    return reports
+
 
 class VectorStore(ABC):
-    def __init__(self):
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
         # Create directory if it doesn't exist
         os.makedirs(CHROMA_PERSIST_DIRECTORY, exist_ok=True)
         
-        # Initialize ChromaDB
-        self.client = chromadb.Client(Settings(
-            persist_directory=CHROMA_PERSIST_DIRECTORY,
-            anonymized_telemetry=False
-        ))
+        # Initialize ChromaDB with a durable on-disk client. The HNSW index and
+        # SQLite metadata are reopened on restart instead of being rebuilt. The
+        # embedded client only sees its own process's writes, so processes that
+        # share an index go through a Chroma server instead.
+        if CHROMA_HOST:
+            self.client = chromadb.HttpClient(
+                host=CHROMA_HOST,
+                port=CHROMA_PORT,
+                settings=Settings(anonymized_telemetry=False)
+            )
+        else:
+            self.client = chromadb.PersistentClient(
+                path=CHROMA_PERSIST_DIRECTORY,
+                settings=Settings(anonymized_telemetry=False)
+            )
         
-        # Create or get collection
-        self.collection = self.client.get_or_create_collection(
-            name="slack_bug_reports",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Serialises writes with the final catch-up step of a migration
+        self._write_lock = threading.Lock()
+        # Query embeddings computed ahead of time by search_batch
+        self._local = threading.local()
         
-        # Initialize embedding model
-        self.model = SentenceTransformer(EMBEDDING_MODEL)
+        # Model and reduction requested by config. The active ones differ only
+        # while a migration to the configured ones is pending.
+        self.target_model_name = model_name
+        self.target_reduction = reduction_spec(EMBEDDING_REDUCTION, EMBEDDING_REDUCED_DIMENSION)
+        self.dedup = NearDuplicateIndex(DEDUP_INDEX_FILE) if DEDUP_ENABLED else None
+        
+        state = self._load_active_state()
+        if state.get("model_name"):
+            active_model_name, active_reduction = state["model_name"], state.get("reduction")
+        else:
+            # A PCA projection is fitted on the corpus, so a new index starts unreduced
+            # and is migrated once there are documents to fit on
+            active_model_name = model_name
+            active_reduction = self.target_reduction
+            if active_reduction and not has_reducer(model_name, active_reduction):
+                active_reduction = None
+        self._active = ActiveIndex(
+            active_model_name, self.get_collection_for(active_model_name, active_reduction), active_reduction
+        )
+        self._active_mtime = None
+        if not self.needs_migration():
+            self._save_active_state(active_model_name, active_reduction)
+        self.migration = None
+
+    @property
+    def _index(self) -> ActiveIndex:
+        """The serving index, following switches made by other processes sharing the directory"""
+        try:
+            mtime = os.stat(ACTIVE_INDEX_FILE).st_mtime_ns
+        except OSError:
+            return self._active
+        if mtime != self._active_mtime:
+            self._active_mtime = mtime
+            state = self._load_active_state()
+            model_name, reduction = state.get("model_name"), state.get("reduction")
+            active = self._active
+            if model_name and (model_name, reduction) != (active.model_name, active.reduction):
+                logger.info(f"Index switched by another process, now serving {model_name} ({reduction or 'full dimension'})")
+                self._active = ActiveIndex(model_name, self.get_collection_for(model_name, reduction), reduction)
+        return self._active
+
+    @property
+    def embedding_model_name(self) -> str:
+        return self._index.model_name
+
+    @property
+    def collection(self):
+        return self._index.collection
+
+    @property
+    def reduction(self) -> Optional[str]:
+        return self._index.reduction
+
+    @property
+    def model(self):
+        """Embedding model, shared with every other store using the same model"""
+        return model_registry.get_embedding_model(self.embedding_model_name)
+
+    def model_specs(self) -> List[Tuple[str, str]]:
+        """Models this store needs, as (kind, name) pairs for the registry"""
+        specs = [(EMBEDDING, self.embedding_model_name)]
+        if self.needs_migration():
+            specs.append((EMBEDDING, self.target_model_name))
+        return specs
+
+    def get_collection_for(self, model_name: str, reduction: Optional[str] = None):
+        """Create or get the collection holding embeddings from the given model and reduction"""
+        if reduction:
+            dimension = parse_spec(reduction)[1]
+        else:
+            dimension = model_registry.get_embedding_dimension(model_name)
+        name = collection_name_for(model_name, dimension, reduction)
+        metadata = {"hnsw:space": "cosine", "embedding_model": model_name, "dimension": dimension}
+        if reduction:
+            metadata["reduction"] = reduction
+        if SHARD_BY_CHANNEL:
+            # One collection per channel; searches only touch the channels they filter on
+            return ShardedCollection(
+                self.client, name, metadata,
+                linked_channels=self.dedup.linked_channels if self.dedup else None
+            )
+        return self.client.get_or_create_collection(name=name, metadata=metadata)
+
+    def needs_migration(self) -> bool:
+        """True when the serving collection was built with a different model or reduction than configured"""
+        index = self._index
+        return (index.model_name, index.reduction) != (self.target_model_name, self.target_reduction)
+
+    def migration_deferred(self) -> Optional[str]:
+        """Why the pending migration cannot run yet, or None if it can"""
+        if not self.target_reduction or has_reducer(self.target_model_name, self.target_reduction):
+            return None
+        # A PCA projection needs at least as many documents to fit on as it has components
+        dimension = parse_spec(self.target_reduction)[1]
+        available = min(self.collection.count(), PCA_FIT_SAMPLE)
+        if available < dimension:
+            return f"fitting {self.target_reduction} needs {dimension} documents, {available} available"
+        return None
+
+    def start_migration(self, background: bool = True) -> Optional[EmbeddingMigration]:
+        """Re-embed the serving collection with the configured model and switch over when done.
+        Returns None when the migration has to wait for more documents."""
+        deferred = self.migration_deferred()
+        if deferred:
+            logger.info(f"Migration deferred: {deferred}. Run 'migrate' or restart once more reports are indexed")
+            return None
+        if self.migration is None or self.migration.state in ("completed", "failed"):
+            self.migration = EmbeddingMigration(self, self.target_model_name)
+            if background:
+                self.migration.start_in_background()
+            else:
+                self.migration.run()
+        return self.migration
+
+    def switch_index(self, model_name: str, collection, reduction: Optional[str] = None):
+        """Atomically point reads and writes at another model's collection"""
+        self._active = ActiveIndex(model_name, collection, reduction)
+        self._save_active_state(model_name, reduction)
+
+    def _load_active_state(self) -> Dict[str, Any]:
+        if not os.path.exists(ACTIVE_INDEX_FILE):
+            return {}
+        try:
+            with open(ACTIVE_INDEX_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_active_state(self, model_name: str, reduction: Optional[str]):
+        with atomic_write(ACTIVE_INDEX_FILE) as f:
+            json.dump({"model_name": model_name, "reduction": reduction}, f)
+        self._active_mtime = os.stat(ACTIVE_INDEX_FILE).st_mtime_ns
+
+    def _query(self, query: str, n_results: int, where: Optional[Dict[str, Any]] = None, **kwargs) -> Dict[str, Any]:
+        """Embed the query and search the active collection using one consistent index snapshot"""
+        index = self._index
+        if where:
+            kwargs["where"] = where
+        prepared = getattr(self._local, "prepared", None)
+        if prepared and (index.model_name, index.reduction, query) in prepared:
+            query_embedding = [prepared[(index.model_name, index.reduction, query)]]
+        else:
+            query_embedding = embed(index.model_name, index.reduction, [query])
+        # Embeddings are only fetched when asked for (MMR), saving n x dimension floats per query
+        if kwargs.get("include") is None:
+            kwargs["include"] = RESULT_INCLUDE
+        return index.collection.query(
+            query_embeddings=query_embedding,
+            n_results=n_results,
+            **kwargs
+        )
     
     def _create_document_id(self, message: Dict[str, Any]) -> str:
         """Create a unique ID for each message"""
@@ -42,15 +284,85 @@ class VectorStore(ABC):
         if not messages:
             return
         
-        documents = []
-        ids = []
-        metadatas = []
-        
         for message in messages:
             # Add channel_id to message if provided
             if channel_id:
                 message["channel_id"] = channel_id
+        
+        with self._write_lock:
+            # Collapse near-duplicates (cross-posts, reposts) before they are embedded
+            canonical_ids = [None] * len(messages)
+            if self.dedup:
+                canonical_ids = self.dedup.classify([
+                    (self._create_document_id(message), message["text"], message.get("channel_id"), message)
+                    for message in messages
+                ])
             
+            try:
+                self._add_documents([
+                    message for message, canonical_id in zip(messages, canonical_ids)
+                    if canonical_id is None
+                ])
+            except Exception:
+                if self.dedup:
+                    self.dedup.rollback()
+                raise
+            
+            if self.dedup:
+                self.dedup.commit()
+                linked = sorted({canonical_id for canonical_id in canonical_ids if canonical_id is not None})
+                if linked:
+                    self._flag_linked_channels(linked)
+                duplicates = sum(1 for canonical_id in canonical_ids if canonical_id is not None)
+                if duplicates:
+                    logger.info(f"Skipped {duplicates} of {len(messages)} messages as near-duplicates")
+    
+    def _flag_linked_channels(self, canonical_ids: List[str]):
+        """Flag canonical documents with the channels of the duplicates collapsed into them,
+        so a channel filter still finds a report that was cross-posted into that channel"""
+        index = self._index
+        existing = index.collection.get(ids=canonical_ids, include=["metadatas"])
+        ids, metadatas = [], []
+        for doc_id, metadata in zip(existing["ids"], existing["metadatas"]):
+            flags = {
+                channel_flag(duplicate["channel_id"]): True
+                for duplicate in self.dedup.get_duplicates(doc_id)
+                if duplicate["channel_id"] and duplicate["channel_id"] != metadata.get("channel_id")
+            }
+            if all(metadata.get(flag) for flag in flags):
+                continue
+            ids.append(doc_id)
+            # A new indexed_at makes a running migration carry the flags over
+            metadatas.append(dict(metadata, **flags, indexed_at=time.time()))
+        if ids:
+            index.collection.update(ids=ids, metadatas=metadatas)
+    
+    def get_thread_states(self, channel_id: str) -> Dict[str, Dict[str, Any]]:
+        """Thread state recorded for each indexed or collapsed parent in a channel, keyed by ts"""
+        # Near-duplicates never reach the collection; their state lives in the dedup index
+        states = self.dedup.thread_states(channel_id) if self.dedup else {}
+        results = self.collection.get(where={"channel_id": channel_id}, include=["metadatas"])
+        states.update({
+            metadata["timestamp"]: {
+                "reply_count": metadata.get("reply_count", 0),
+                "latest_reply": metadata.get("latest_reply", "")
+            }
+            for metadata in results.get("metadatas") or []
+            # Documents indexed before filterable metadata existed are refreshed once
+            if "ts_epoch" in metadata
+        })
+        return states
+    
+    def _add_documents(self, messages: List[Dict[str, Any]]):
+        """Embed messages and write them to the active collection"""
+        if not messages:
+            return
+        
+        documents = []
+        ids = []
+        metadatas = []
+        
+        for message in messages:
             doc_id = self._create_document_id(message)
             document = self._prepare_document(message)
             
@@ -59,6 +371,14 @@ class VectorStore(ABC):
                 "timestamp": message["ts"],
                 "date": message["date"],
                 "user": message["user"]["real_name"],
+                "channel_id": message.get("channel_id", ""),
+                # Numeric timestamp so date ranges can be filtered inside the index
+                "ts_epoch": float(message["ts"]),
+                # Thread state at indexing time, compared on later ingests to skip unchanged threads
+                "reply_count": int(message.get("reply_count", 0)),
+                "latest_reply": message.get("latest_reply", ""),
+                # Lets a running migration re-copy documents updated in place during its bulk copy
+                "indexed_at": time.time(),
                 "original_message": json.dumps(message)
             }
             
@@ -66,10 +386,12 @@ class VectorStore(ABC):
             ids.append(doc_id)
             metadatas.append(metadata)
         
-        # Generate embeddings and add to collection
-        embeddings = self.model.encode(documents).tolist()
+        # Generate embeddings and add to collection. Upsert so a re-ingested
+        # thread replaces its earlier document instead of being ignored.
+        index = self._index
+        embeddings = embed(index.model_name, index.reduction, documents)
         
-        self.collection.add(
+        index.collection.upsert(
             documents=documents,
             embeddings=embeddings,
             ids=ids,
@@ -77,5 +399,37 @@ class VectorStore(ABC):
         )
     
     @abstractmethod
-    def search_similar(self, query: str, n_results: int):
-        pass
\ No newline at end of file
+    def search_similar(self, query: str, n_results: int, where: Optional[Dict[str, Any]] = None,
+                       deadline: Optional[Deadline] = None, include: Optional[List[str]] = None):
+        pass
+    
+    def search(self, query: str, n_results: int, diversity: float = 0.0, where: Optional[Dict[str, Any]] = None,
+               deadline: Optional[Deadline] = None):
+        """Search with optional metadata filters and maximal-marginal-relevance diversification.
+        
+        where (see build_where) is applied inside the index query. With
+        diversity > 0, a larger candidate pool is ranked by search_similar and
+        MMR picks n_results that are relevant but not redundant. A deadline
+        lets search_similar shrink its reranking to fit the time left.
+        Candidate embeddings are only fetched for MMR.
+        """
+        if diversity <= 0:
+            return self.search_similar(query, n_results, where=where, deadline=deadline)
+        
+        results = self.search_similar(
+            query, n_results * MMR_CANDIDATE_MULTIPLIER, where=where, deadline=deadline, include=MMR_INCLUDE
+        )
+        return apply_mmr(results, n_results, diversity)
+    
+    def search_batch(self, queries: List[str], n_results: int, diversity: float = 0.0,
+                     where: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Search many queries, encoding all of them in a single model call"""
+        if not queries:
+            return []
+        index = self._index
+        embeddings = embed(index.model_name, index.reduction, queries)
+        self._local.prepared = {(index.model_name, index.reduction, q): e for q, e in zip(queries, embeddings)}
+        try:
+            return [self.search(q, n_results, diversity=diversity, where=where) for q in queries]
+        finally:
+            self._local.prepared = None
\ No newline at end of file
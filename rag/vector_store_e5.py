@@ -1,22 +1,44 @@
-from typing import List, Dict, Any
+import time
+from typing import List, Dict, Any, Optional
 
-from vector_store import VectorStore
-from sentence_transformers import CrossEncoder
+from rag.vector_store import VectorStore
+from rag.deadline import Deadline, StageCost
+from config import EMBEDDING_MODEL, DEADLINE_RERANK_SHARE
+from rag.model_registry import model_registry, CROSS_ENCODER
 import numpy as np
 
+# Initial guess of cross-encoder seconds per query/document pair, refined from observed reranks
+RERANK_SECONDS_PER_PAIR = 0.005
+
 class E5VectorStore(VectorStore):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        super().__init__(model_name)
         # Add a cross-encoder for reranking
         # available options:
         # cross-encoder/ms-marco-MiniLM-L-6-v2
         # cross-encoder/stsb-roberta-base
         # cross-encoder/ms-marco-electra-base
         # cross-encoder/ms-marco-deberta-v3-large
-        self.cross_encoder = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2')
-       
-        
-    def _prepare_document(self, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.cross_encoder_model_name = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+        self._rerank_cost = StageCost(RERANK_SECONDS_PER_PAIR)
+
+    @property
+    def cross_encoder(self):
+        """Cross-encoder for reranking, loaded lazily through the shared registry"""
+        return model_registry.get_cross_encoder(self.cross_encoder_model_name)
+
+    def model_specs(self):
+        return super().model_specs() + [(CROSS_ENCODER, self.cross_encoder_model_name)]
+        
+    def _prepare_document(self, message: Dict[str, Any]) -> str:
+        """One document per message: the issue followed by its thread replies grouped by topic"""
+        chunks = self._chunk_message(message)
+        parts = [chunks[0]["text"]]
+        for chunk in chunks[1:]:
+            parts.append(f"{', '.join(chunk['metadata']['users'])}: {chunk['text']}")
+        return "\n\n".join(parts)
+
+    def _chunk_message(self, message: Dict[str, Any]) -> List[Dict[str, Any]]:
        """Create multiple sophisticated chunks from each message"""
        chunks = []
        
@@ -32,11 +54,11 @@ class E5VectorStore(VectorStore):
        chunks.append(main_chunk)
        
        # Thread context as separate but linked chunks
-       if "thread_context" in message and len(message["thread_context"]) > 0:
+       if "replies" in message and len(message["replies"]) > 0:
            # Group responses by topic using simple heuristics
            current_topic = {"texts": [], "users": []}
            
-           for reply in message["thread_context"]:
+           for reply in message["replies"]:
                # Start a new topic if different user or significant time gap
                if (reply["user"]["real_name"] not in current_topic["users"] and 
                    len(current_topic["texts"]) > 0):
@@ -72,34 +94,60 @@ class E5VectorStore(VectorStore):
        
        return chunks
         
-    def search_similar(self, query: str, n_results: int = 5, rerank_candidates: int = 25):
-        """Two-stage retrieval with cross-encoder reranking"""
+    def search_similar(self, query: str, n_results: int = 5, where: Optional[Dict[str, Any]] = None,
+                       rerank_candidates: int = 25, deadline: Optional[Deadline] = None,
+                       include: Optional[List[str]] = None):
+        """Two-stage retrieval with cross-encoder reranking.
+        
+        With a deadline, only as many candidates as the cross-encoder can score
+        in time are reranked; if fewer than n_results fit, the bi-encoder
+        ranking is returned as is.
+        """
+        if deadline is not None:
+            affordable = deadline.fit(rerank_candidates, self._rerank_cost.per_item, DEADLINE_RERANK_SHARE)
+            if affordable < min(n_results, rerank_candidates):
+                deadline.degrade("rerank_skipped")
+                return self._query(query, n_results=n_results, where=where, include=include)
+            if affordable < rerank_candidates:
+                deadline.degrade("rerank_reduced")
+                rerank_candidates = affordable
+        
         # Stage 1: Semantic search with bi-encoder (your embedding model)
         # This retrieves initial candidates efficiently
-        query_embedding = self.model.encode([query]).tolist()
-        candidates = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=rerank_candidates  # Get more candidates for reranking
+        candidates = self._query(
+            query,
+            n_results=rerank_candidates,  # Get more candidates for reranking
+            where=where,
+            include=include
         )
         
         # Extract candidate documents
         candidate_docs = candidates.get("documents", [[]])[0]
         candidate_metadata = candidates.get("metadatas", [[]])[0]
+        candidate_ids = candidates.get("ids", [[]])[0]
+        # Only present when the caller asked for them
+        with_embeddings = candidates.get("embeddings") is not None
+        candidate_embeddings = candidates["embeddings"][0] if with_embeddings else [None] * len(candidate_ids)
         
         if not candidate_docs:
-            return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "embeddings": [[]]}
         
         # Stage 2: Precise reranking with cross-encoder
         # This is computationally intensive but provides better ranking
         query_doc_pairs = [[query, doc] for doc in candidate_docs]
         
         # Get cross-encoder scores
-        cross_scores = self.cross_encoder.predict(query_doc_pairs)
+        cross_encoder = self.cross_encoder
+        started = time.monotonic()
+        cross_scores = cross_encoder.predict(query_doc_pairs)
+        self._rerank_cost.observe(len(query_doc_pairs), time.monotonic() - started)
         
         # Combine candidates with their scores
         scored_results = [
-            {"document": doc, "metadata": meta, "score": score}
-            for doc, meta, score in zip(candidate_docs, candidate_metadata, cross_scores)
+            {"id": doc_id, "document": doc, "metadata": meta, "embedding": emb, "score": score}
+            for doc_id, doc, meta, emb, score in zip(
+                candidate_ids, candidate_docs, candidate_metadata, candidate_embeddings, cross_scores
+            )
         ]
         
         # Sort by cross-encoder score (higher is better)
@@ -110,9 +158,11 @@ class E5VectorStore(VectorStore):
         
         # Format results to match expected return format
         return {
+            "ids": [[r["id"] for r in top_results]],
             "documents": [[r["document"] for r in top_results]],
             "metadatas": [[r["metadata"] for r in top_results]],
-            "distances": [[1 - min(1, max(0, r["score"]/5)) for r in top_results]]  # Normalize scores to distances
+            "distances": [[1 - min(1, max(0, r["score"]/5)) for r in top_results]],  # Normalize scores to distances
+            "embeddings": [[r["embedding"] for r in top_results]] if with_embeddings else None
         }
         
     def search_with_explanations(self, query: str, n_results: int = 5):
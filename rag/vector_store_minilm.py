@@ -1,18 +1,13 @@
-import os
-from typing import List, Dict, Any
-import chromadb
-from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
-import json
-import hashlib
+from typing import List, Dict, Any, Optional
 
-from vector_store import VectorStore
+from rag.vector_store import VectorStore
+from rag.deadline import Deadline
 
-from config import CHROMA_PERSIST_DIRECTORY, EMBEDDING_MODEL
+from config import EMBEDDING_MODEL
 
 class MiniLmVectorStore(VectorStore):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        super().__init__(model_name)
     
     def _prepare_document(self, message: Dict[str, Any]) -> str:
         """Format message into a document for embedding"""
@@ -29,13 +24,9 @@ class MiniLmVectorStore(VectorStore):
         
         return doc
     
-    def search_similar(self, query: str, n_results: int):
-        """Search for similar bug reports"""
-        query_embedding = self.model.encode([query]).tolist()
-        
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results
-        )
+    def search_similar(self, query: str, n_results: int, where: Optional[Dict[str, Any]] = None,
+                       deadline: Optional[Deadline] = None, include: Optional[List[str]] = None):
+        """Search for similar bug reports. There is no reranking to shorten for a deadline."""
+        results = self._query(query, n_results=n_results, where=where, include=include)
         
         return results 
\ No newline at end of file
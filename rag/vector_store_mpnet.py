@@ -1,11 +1,19 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from vector_store import VectorStore
+import time
+
+from rag.vector_store import VectorStore
+from rag.deadline import Deadline, StageCost
+from config import EMBEDDING_MODEL, DEADLINE_RERANK_SHARE
+
+# Initial guess of the seconds reranking each over-fetched candidate takes, refined from observed searches
+OVERFETCH_SECONDS_PER_ITEM = 0.0005
 
 
 class MPNetVectorStore(VectorStore):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        super().__init__(model_name)
+        self._overfetch_cost = StageCost(OVERFETCH_SECONDS_PER_ITEM)
         
     def _prepare_document(self, message: Dict[str, Any]) -> str:
         """Format message into a document optimized for semantic search"""
@@ -16,9 +24,9 @@ class MPNetVectorStore(VectorStore):
         parts.append(f"ISSUE: {message['text']}")
         
         # Add structured context from thread
-        if "thread_context" in message and message["thread_context"]:
+        if "replies" in message and message["replies"]:
             parts.append("CONTEXT:")
-            for i, reply in enumerate(message["thread_context"]):
+            for i, reply in enumerate(message["replies"]):
                 # Only include substantive messages (not just acknowledgments)
                 if len(reply["text"]) > 10:  # Skip very short replies
                     parts.append(f"- {reply['text']}")
@@ -37,27 +45,40 @@ class MPNetVectorStore(VectorStore):
         # Combine all parts with clear separation
         return "\n\n".join(parts)
         
-    def search_similar(self, query: str, n_results: int = 5):
+    def search_similar(self, query: str, n_results: int = 5, where: Optional[Dict[str, Any]] = None,
+                       deadline: Optional[Deadline] = None, include: Optional[List[str]] = None):
         """Enhanced semantic search with hybrid retrieval"""
-        # Generate embedding for the query
-        query_embedding = self.model.encode([query]).tolist()
+        # Get more results for reranking, as many as fit in the deadline
+        fetch = n_results * 2
+        if deadline is not None:
+            fetch = max(n_results, deadline.fit(fetch, self._overfetch_cost.per_item, DEADLINE_RERANK_SHARE))
+            if fetch < n_results * 2:
+                deadline.degrade("rerank_reduced")
         
         # Get results based on vector similarity
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results * 2  # Get more results for reranking
+        results = self._query(
+            query,
+            n_results=fetch,
+            where=where,
+            include=include
         )
         
         # Extract the documents and metadata
         documents = results.get("documents", [[]])[0]
         metadatas = results.get("metadatas", [[]])[0]
         distances = results.get("distances", [[]])[0]
+        ids = results.get("ids", [[]])[0]
+        # Only present when the caller asked for them
+        with_embeddings = results.get("embeddings") is not None
+        embeddings = results["embeddings"][0] if with_embeddings else [None] * len(ids)
         
-        # Simple reranking based on keyword presence
+        # Simple reranking based on keyword presence. Only this part grows with the
+        # number of candidates; the query embedding costs the same however many are fetched.
+        started = time.monotonic()
         ranked_results = []
         keywords = self._extract_keywords(query)
         
-        for i, (doc, meta, dist) in enumerate(zip(documents, metadatas, distances)):
+        for i, (doc_id, doc, meta, dist, emb) in enumerate(zip(ids, documents, metadatas, distances, embeddings)):
             # Calculate keyword score (simple approach)
             keyword_score = sum(1 for kw in keywords if kw.lower() in doc.lower())
             
@@ -67,6 +88,8 @@ class MPNetVectorStore(VectorStore):
             combined_score = (semantic_score * 0.7) + (keyword_score * 0.3 / max(1, len(keywords)))
             
             ranked_results.append({
+                "id": doc_id,
+                "embedding": emb,
                 "document": doc,
                 "metadata": meta,
                 "semantic_score": semantic_score,
@@ -77,12 +100,15 @@ class MPNetVectorStore(VectorStore):
         # Sort by combined score and take top n
         ranked_results.sort(key=lambda x: x["combined_score"], reverse=True)
         top_results = ranked_results[:n_results]
+        self._overfetch_cost.observe(len(ids), time.monotonic() - started)
         
         # Reformat back to chromadb result format
         final_results = {
+            "ids": [[r["id"] for r in top_results]],
             "documents": [[r["document"] for r in top_results]],
             "metadatas": [[r["metadata"] for r in top_results]],
-            "distances": [[1 - r["combined_score"] for r in top_results]]
+            "distances": [[1 - r["combined_score"] for r in top_results]],
+            "embeddings": [[r["embedding"] for r in top_results]] if with_embeddings else None
         }
         
         return final_results
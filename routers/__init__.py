@@ -1,5 +1,6 @@
 from .search import SearchRouter
 from .ingest import IngestRouter
 from .status import StatusRouter
+from .slack_events import SlackEventsRouter
 
-__all__ = ["search", "ingest", "status"]
\ No newline at end of file
+__all__ = ["search", "ingest", "status", "slack_events"]
\ No newline at end of file
@@ -35,7 +35,12 @@ def ingest_data_task(channels=None, limit=1000):
     
     for channel_id in channels:
         logger.info(f"Processing channel: {channel_id}")
-        messages = extractor.get_messages(channel_id, limit=limit)
+        # Only threads that changed since they were indexed are fetched and re-embedded
+        messages = extractor.get_messages(
+            channel_id,
+            limit=limit,
+            indexed_threads=vector_store.get_thread_states(channel_id)
+        )
         logger.info(f"Found {len(messages)} bug reports in channel")
         vector_store.add_messages(messages, channel_id)
         total_messages += len(messages)
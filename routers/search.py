@@ -1,13 +1,23 @@
 from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi.concurrency import run_in_threadpool
+import asyncio
 import time
 import logging
+from config import LLM_SHED_MODE, SEARCH_DEADLINE_MS, DEADLINE_MIN_LLM_MS
+from llm.admission import LLMOverloadedError
+from llm.ollama import LLMTimeoutError
+from rag.deadline import Deadline
 from dto.request.search_request import SearchQuery
 from dto.response.search_response import SearchResponse
 from auth.api_key import verify_api_key
+from rag.vector_store import build_where, format_results
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Extra time the LLM gets to hand back its partial answer before the call is abandoned
+LLM_CUTOFF_GRACE = 0.25
+
 # Create router with prefix
 SearchRouter = APIRouter(
     prefix="/search",
@@ -27,25 +37,62 @@ def init(vs, llm):
 
 @SearchRouter.post("", response_model=SearchResponse)
 async def search_similar_bugs(search_request: SearchQuery):
-    """Search for similar bug reports based on a query"""
+    """Search for similar bug reports based on a query.
+    
+    With a deadline_ms budget, stages that would overrun it are shortened or
+    skipped and listed in `degraded`; retrieval results are always returned.
+    """
     start_time = time.time()
+    deadline = Deadline.from_ms(search_request.deadline_ms or SEARCH_DEADLINE_MS)
+    degraded = deadline.degraded if deadline else []
     
     try:
         # Get similar bug reports
-        results = vector_store.search_similar(search_request.query, n_results=search_request.max_results)
+        where = build_where(
+            channels=search_request.channels,
+            start_ts=search_request.start_date.timestamp() if search_request.start_date else None,
+            end_ts=search_request.end_date.timestamp() if search_request.end_date else None
+        )
+        # Retrieval can wait on a model that is still loading; keep it off the event loop
+        # so /ready and other requests are answered meanwhile
+        results = await run_in_threadpool(
+            vector_store.search,
+            search_request.query,
+            n_results=search_request.max_results,
+            diversity=search_request.diversity,
+            where=where,
+            deadline=deadline
+        )
         
-        # Generate response with Ollama
-        analysis = ollama.generate_response(search_request.query, results)
+        # Generate response with Ollama. Runs in the threadpool so waiting for an
+        # LLM slot does not block the event loop.
+        try:
+            if deadline is None:
+                analysis = await run_in_threadpool(ollama.generate_response, search_request.query, results)
+            elif deadline.remaining() * 1000 < DEADLINE_MIN_LLM_MS:
+                raise LLMTimeoutError("Not enough time left for LLM analysis")
+            else:
+                remaining = deadline.remaining()
+                analysis = await asyncio.wait_for(
+                    run_in_threadpool(ollama.generate_response, search_request.query, results, timeout=remaining),
+                    timeout=remaining + LLM_CUTOFF_GRACE
+                )
+        except (LLMTimeoutError, asyncio.TimeoutError) as e:
+            analysis = getattr(e, "partial", "")
+            degraded.append("llm_truncated" if analysis else "llm_skipped")
+        except LLMOverloadedError as e:
+            logger.warning(f"Shedding LLM analysis: {str(e)}")
+            if LLM_SHED_MODE == "reject":
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="LLM is overloaded, please retry shortly",
+                    headers={"Retry-After": "5"}
+                )
+            analysis = ""
+            degraded.append("llm_overloaded")
         
         # Format response
-        similar_reports = []
-        for i, doc in enumerate(results.get("documents", [[]])[0]):
-            metadata = results.get("metadatas", [[]])[0][i] if i < len(results.get("metadatas", [[]])[0]) else {}
-            similar_reports.append({
-                "document": doc,
-                "metadata": metadata,
-                "score": results.get("distances", [[]])[0][i] if i < len(results.get("distances", [[]])[0]) else None
-            })
+        similar_reports = format_results(results)
         
         processing_time = time.time() - start_time
         
@@ -53,9 +100,12 @@ async def search_similar_bugs(search_request: SearchQuery):
             query=search_request.query,
             similar_reports=similar_reports,
             analysis=analysis,
-            processing_time=processing_time
+            processing_time=processing_time,
+            degraded=degraded
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in search: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing search: {str(e)}") 
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Request
+import json
+import logging
+from config import SLACK_SIGNING_SECRET
+from ingest.slack_events import verify_slack_signature
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Create router with prefix. Slack cannot send our API key, so requests are
+# authenticated with the Slack signing secret instead.
+SlackEventsRouter = APIRouter(
+    prefix="/slack/events",
+    tags=["slack"]
+)
+
+# Dependencies will be passed from the main app
+event_queue = None
+
+def init(queue):
+    """Initialize the router with dependencies"""
+    global event_queue
+    event_queue = queue
+
+@SlackEventsRouter.post("")
+async def receive_event(request: Request):
+    """Receive Slack Events API callbacks and queue message events for indexing"""
+    body = await request.body()
+    if not verify_slack_signature(
+        SLACK_SIGNING_SECRET,
+        request.headers.get("X-Slack-Request-Timestamp", ""),
+        body,
+        request.headers.get("X-Slack-Signature", "")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid Slack signature")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    # Slack verifies the endpoint once by asking us to echo a challenge
+    if payload.get("type") == "url_verification":
+        return {"challenge": payload.get("challenge")}
+
+    if payload.get("type") == "event_callback":
+        event_queue.handle_event(payload.get("event", {}))
+
+    # Acknowledge immediately; indexing happens when the queue flushes
+    return {"ok": True}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 import logging
 from auth.api_key import verify_api_key
+from rag.model_registry import model_registry, EMBEDDING
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,12 +16,14 @@ StatusRouter = APIRouter(
 # Dependencies will be passed from the main app
 vector_store = None
 ollama = None
+event_queue = None
 
-def init(vs, llm):
+def init(vs, llm, queue=None):
     """Initialize the router with dependencies"""
-    global vector_store, ollama
+    global vector_store, ollama, event_queue
     vector_store = vs
     ollama = llm
+    event_queue = queue
 
 @StatusRouter.get("")
 async def get_status():
@@ -28,16 +31,32 @@ async def get_status():
     try:
         # Get collection info from vector store
         collection_info = vector_store.collection.count()
+        models = model_registry.status()
+        
+        # Only report the dimension once loaded; asking for it would block on the warm-up
+        embedding_dimension = None
+        if model_registry.is_loaded(EMBEDDING, vector_store.embedding_model_name):
+            embedding_dimension = vector_store.model.get_sentence_embedding_dimension()
         
         return {
-            "status": "ok",
+            "status": "ok" if models["ready"] else "warming_up",
+            "ready": models["ready"],
+            "models": models["models"],
             "vector_store": {
                 "document_count": collection_info,
-                "collection_name": vector_store.collection.name
+                "collection_name": vector_store.collection.name,
+                "active_model": vector_store.embedding_model_name,
+                "configured_model": vector_store.target_model_name,
+                "active_reduction": vector_store.reduction,
+                "configured_reduction": vector_store.target_reduction,
+                "migration": vector_store.migration.status() if vector_store.migration else None,
+                "deduplication": vector_store.dedup.stats() if vector_store.dedup else None
             },
-            "embedding_model": vector_store.model.get_sentence_embedding_dimension(),
+            "embedding_model": embedding_dimension,
             "llm_model": ollama.model,
-            "llm_endpoint": ollama.base_url
+            "llm_endpoint": ollama.base_url,
+            "llm_admission": ollama.status() if hasattr(ollama, "status") else None,
+            "slack_events": event_queue.status() if event_queue else None
         }
     
     except Exception as e:
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from llm.admission import AdmissionControlledLLM, LLMOverloadedError
+from llm.ollama import LLMTimeoutError
+
+CONTEXT = {"documents": [["report"]]}
+
+
+class BlockingLLM:
+    """Generations block until released; a budget shorter than the generation is cut off"""
+
+    def __init__(self, duration=None):
+        self.release = threading.Event()
+        self.calls = 0
+        self.duration = duration
+
+    def generate_response(self, query, context, timeout=None):
+        self.calls += 1
+        if self.duration is not None:
+            if timeout is not None and timeout < self.duration:
+                time.sleep(timeout)
+                raise LLMTimeoutError("cut", partial="")
+            time.sleep(self.duration)
+        else:
+            self.release.wait(5)
+        return f"analysis of {query}"
+
+
+def start(llm, query, results, timeout=None):
+    def run():
+        try:
+            results.append(llm.generate_response(query, CONTEXT, timeout=timeout))
+        except Exception as e:
+            results.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_calls_beyond_slots_and_queue_are_shed():
+    inner = BlockingLLM()
+    llm = AdmissionControlledLLM(inner, max_concurrent=1, max_queue=0, queue_timeout=5)
+    results = []
+    thread = start(llm, "first", results)
+    wait_for(lambda: inner.calls == 1)
+
+    with pytest.raises(LLMOverloadedError):
+        llm.generate_response("second", CONTEXT)
+    assert llm.status()["shed"] == 1
+
+    inner.release.set()
+    thread.join()
+    assert results == ["analysis of first"]
+    assert llm.status()["running"] == 0
+
+
+def test_identical_prompts_share_one_generation():
+    inner = BlockingLLM()
+    llm = AdmissionControlledLLM(inner, max_concurrent=1, max_queue=0, queue_timeout=5)
+    results = []
+    threads = [start(llm, "same", results)]
+    wait_for(lambda: inner.calls == 1)
+    # Joins the running generation instead of being shed for lack of a slot
+    threads.append(start(llm, "same", results))
+    wait_for(lambda: llm.status()["coalesced"] == 1)
+
+    inner.release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["analysis of same", "analysis of same"]
+    assert inner.calls == 1
+    assert llm.status()["in_flight_prompts"] == 0
+
+
+def test_caller_without_budget_does_not_inherit_a_tighter_budget():
+    inner = BlockingLLM(duration=0.3)
+    llm = AdmissionControlledLLM(inner, max_concurrent=2, max_queue=2, queue_timeout=5)
+    leader, follower = [], []
+    threads = [start(llm, "same", leader, timeout=0.1)]
+    wait_for(lambda: inner.calls == 1)
+    threads.append(start(llm, "same", follower))
+    for thread in threads:
+        thread.join()
+
+    assert isinstance(leader[0], LLMTimeoutError)
+    assert follower == ["analysis of same"]
+    assert llm.status()["coalesced"] == 0
@@ -0,0 +1,63 @@
+from rag.dedup import NearDuplicateIndex
+
+REPORT = "the build fails on arm64 with a segfault in the linker when lto is enabled"
+REPOST = REPORT + " please help"
+OTHER = "checkout page times out when paying with a saved card in safari"
+
+
+def state(ts, reply_count=0, latest_reply=""):
+    return {"ts": ts, "reply_count": reply_count, "latest_reply": latest_reply}
+
+
+def test_classify_links_near_duplicates_within_a_batch(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.sqlite3"))
+    result = index.classify([
+        ("a", REPORT, "C1", state("1.0")),
+        ("b", REPOST, "C2", state("2.0")),
+        ("c", OTHER, "C1", state("3.0")),
+    ])
+    assert result == [None, "a", None]
+
+
+def test_nothing_is_written_before_commit(tmp_path):
+    path = str(tmp_path / "dedup.sqlite3")
+    index = NearDuplicateIndex(path)
+    index.classify([("a", REPORT, "C1", state("1.0"))])
+    assert NearDuplicateIndex(path).stats()["messages_seen"] == 0
+
+    index.commit()
+    other = NearDuplicateIndex(path)
+    assert other.stats()["messages_seen"] == 1
+    # Committed canonical documents are candidates for other processes too
+    assert other.classify([("b", REPOST, "C2", state("2.0"))]) == ["a"]
+
+
+def test_rollback_forgets_pending_rows(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.sqlite3"))
+    index.classify([("a", REPORT, "C1", state("1.0"))])
+    index.rollback()
+    index.commit()
+    assert index.stats()["messages_seen"] == 0
+    assert index.classify([("b", REPOST, "C2", state("2.0"))]) == [None]
+
+
+def test_reingest_keeps_classification_and_updates_thread_state(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.sqlite3"))
+    index.classify([("a", REPORT, "C1", state("1.0")), ("b", REPOST, "C2", state("2.0", 1, "2.5"))])
+    index.commit()
+
+    assert index.classify([("a", REPORT, "C1", state("1.0")), ("b", REPOST, "C2", state("2.0", 2, "2.9"))]) == [None, "a"]
+    index.commit()
+    assert index.stats()["duplicates_collapsed"] == 1
+    assert index.thread_states("C2") == {"2.0": {"reply_count": 2, "latest_reply": "2.9"}}
+    # Canonical documents keep their state in the vector store, not here
+    assert index.thread_states("C1") == {}
+
+
+def test_linked_channels_point_at_the_canonical_documents_channel(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "dedup.sqlite3"))
+    index.classify([("a", REPORT, "C1", state("1.0")), ("b", REPOST, "C2", state("2.0"))])
+    index.commit()
+    assert index.linked_channels(["C2"]) == ["C1"]
+    assert index.linked_channels(["C1"]) == []
+    assert index.get_duplicates("a") == [{"doc_id": "b", "channel_id": "C2"}]
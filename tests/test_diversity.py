@@ -0,0 +1,39 @@
+import numpy as np
+
+from rag.diversity import apply_mmr, mmr_select
+
+# Two near-identical candidates and one in another direction
+EMBEDDINGS = np.array([[1.0, 0.0], [0.99, 0.01], [0.0, 1.0]], dtype=np.float32)
+RELEVANCE = np.array([0.9, 0.85, 0.6], dtype=np.float32)
+
+
+def test_no_diversity_keeps_relevance_order():
+    assert mmr_select(RELEVANCE, EMBEDDINGS, 3, 0.0) == [0, 1, 2]
+
+
+def test_diversity_skips_redundant_candidates():
+    assert mmr_select(RELEVANCE, EMBEDDINGS, 2, 0.5) == [0, 2]
+
+
+def test_selection_is_bounded_by_candidates():
+    assert mmr_select(RELEVANCE, EMBEDDINGS, 10, 0.5) == [0, 2, 1]
+    assert mmr_select(np.array([]), np.zeros((0, 2)), 3, 0.5) == []
+
+
+def test_apply_mmr_reorders_every_per_result_field():
+    results = {
+        "ids": [["a", "b", "c"]],
+        "documents": [["A", "B", "C"]],
+        "distances": [list(1 - RELEVANCE)],
+        "embeddings": [EMBEDDINGS.tolist()],
+        "included": ["documents"],
+    }
+    diversified = apply_mmr(results, 2, 0.5)
+    assert diversified["ids"] == [["a", "c"]]
+    assert diversified["documents"] == [["A", "C"]]
+    assert diversified["included"] == ["documents"]
+
+
+def test_apply_mmr_without_embeddings_truncates():
+    results = {"ids": [["a", "b", "c"]], "distances": [[0.1, 0.2, 0.3]], "embeddings": None}
+    assert apply_mmr(results, 2, 0.5)["ids"] == [["a", "b"]]